@@ -0,0 +1,284 @@
+"""
+ANÁLISIS DE TRAZAS del túnel
+
+Lee una traza binaria (traza.py) después de la ejecución y calcula, con
+operaciones de arrays de NumPy y sin recorrer los registros en Python:
+
+    - distribución de la espera (de "wants to enter" a "enters the tunnel") y
+      del tiempo de cruce, en total y por dirección;
+    - duración de cada turno y coches que entran en cada turno;
+    - intervalos en los que no se cumple el invariante del monitor
+      (north_inside > 0 y south_inside > 0 a la vez, coches de los dos
+      sentidos en un mismo carril, más de K coches en un carril o algún
+      contador negativo), tanto según los contadores del monitor guardados en
+      cada registro como según la ocupación reconstruida a partir de las
+      entradas y salidas;
+    - coches que esperan más de una cota dada, incluidos los que no llegan a
+      entrar antes del final de la traza.
+
+El fichero se proyecta en memoria con numpy.memmap, así que solo se leen las
+columnas que hacen falta y se pueden analizar trazas de varios GB. Termina con
+código 1 si se incumple el invariante.
+
+    python analisis.py fichero.traza
+    python analisis.py fichero.traza --espera-max 10 --escala 0.01 --salida analisis.json
+    python analisis.py fichero.traza --capacidad 4 --separados
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from monitor import NORTH, SOUTH, TURNO
+from traza import CAMPOS, CREADO, QUIERE, ENTRA, SALE, DIRECCIONES
+
+REGISTRO = np.dtype(CAMPOS)
+
+
+def carga(fichero):
+    """Proyecta la traza en memoria como un array de registros (sin leerla)."""
+    if os.path.getsize(fichero) == 0: # no se puede proyectar un fichero vacío
+        return np.empty(0, dtype=REGISTRO)
+    return np.memmap(fichero, dtype=REGISTRO, mode="r")
+
+
+def orden(registros):
+    """
+    Permutación que ordena los registros por instante, o None si ya lo están.
+    Los bloques de cada proceso se escriben por separado, así que en el
+    backend de procesos la traza no está ordenada; en la simulación y con
+    hilos o asyncio sí.
+    """
+    t = registros["t"]
+    if t.size < 2 or np.all(t[1:] >= t[:-1]):
+        return None
+    return np.argsort(t, kind="stable")
+
+
+class Columnas():
+    """
+    Columnas de la traza ordenadas por instante, con los tiempos desde el
+    primer registro. Solo se ordena el índice (orden): cada columna se lee
+    del fichero cuando alguna métrica la pide, ya en orden (np.take con la
+    permutación), y se guarda para las siguientes; las que no se piden no se
+    leen. toma lee solo los registros de una máscara, sin guardarlos.
+    """
+
+    def __init__(self, registros, escala=1.0):
+        self.registros = registros
+        self.escala = escala
+        self.perm = orden(registros)
+        t = registros["t"]
+        self.t0 = float(t[0 if self.perm is None else self.perm[0]]) if t.size else 0.0
+        self.leidas = {}
+
+    def __getitem__(self, nombre):
+        col = self.leidas.get(nombre)
+        if col is None:
+            col = self.leidas[nombre] = self.toma(nombre)
+        return col
+
+    def toma(self, nombre, mascara=None):
+        # la columna dada, en orden de instante, de los registros de la máscara (todos si es None)
+        if nombre in self.leidas and mascara is not None:
+            return self.leidas[nombre][mascara]
+        c = self.registros[nombre]
+        indices = self.perm
+        if mascara is not None:
+            indices = np.flatnonzero(mascara) if indices is None else indices[mascara]
+        col = np.asarray(c) if indices is None else np.take(c, indices)
+        if nombre == "t":
+            col = (col - self.t0) / self.escala
+        return col
+
+
+def resumen(x):
+    x = x[~np.isnan(x)]
+    if x.size == 0:
+        return {"n": 0, "p50": None, "p95": None, "p99": None, "max": None, "media": None}
+    # percentil por rango más cercano, como en benchmark.py
+    p50, p95, p99 = np.percentile(x, [50, 95, 99], method="inverted_cdf")
+    return {"n": int(x.size), "p50": float(p50), "p95": float(p95), "p99": float(p99),
+            "max": float(x.max()), "media": float(x.mean())}
+
+
+def por_coche(c):
+    """
+    Instantes de cada coche: array (4, ncoches) con una fila por tipo de
+    evento (CREADO, QUIERE, ENTRA, SALE) y NaN si el coche no llegó a ese
+    punto; y la dirección de cada coche (-1 si no aparece en la traza). Si un
+    evento se repite (un coche de un convoy que vuelve a solicitar entrar),
+    cuenta el primero: el mínimo de sus instantes (fmin ignora los NaN
+    iniciales; con una asignación con índices repetidos, NumPy no garantiza
+    cuál de los valores queda).
+    """
+    n = int(c["cid"].max()) + 1 if c["cid"].size else 0
+    instantes = np.full((4, n), np.nan)
+    np.fmin.at(instantes, (c["tipo"], c["cid"]), c["t"])
+    direccion = np.full(n, -1, np.int8)
+    direccion[c["cid"]] = c["direccion"]
+    return instantes, direccion
+
+
+def rachas(mascara):
+    """Índices [inicio, fin) de cada racha de valores True."""
+    d = np.diff(np.concatenate(([0], mascara.astype(np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+
+def violaciones(c, capacidad=None, separados=False):
+    """
+    Intervalos en los que se incumple el invariante, sobre los registros del
+    monitor (QUIERE, ENTRA, SALE), que se escriben con el mutex cogido. Cada
+    intervalo va desde el registro en el que empieza a incumplirse hasta el
+    siguiente registro en el que vuelve a cumplirse (o el final de la traza).
+    Con separados (un carril por sentido) los dos sentidos pueden estar
+    dentro a la vez, pero no en el mismo carril.
+    """
+    monitor = c["tipo"] != CREADO
+    t = c.toma("t", monitor)
+    # ocupación según los contadores del propio monitor
+    inside_n = c.toma("inside_n", monitor)
+    inside_s = c.toma("inside_s", monitor)
+    # ocupación reconstruida a partir de las entradas y salidas
+    tipo = c.toma("tipo", monitor)
+    direccion = c.toma("direccion", monitor)
+    carril = c.toma("carril", monitor)
+    delta = (tipo == ENTRA).astype(np.int64) - (tipo == SALE)
+    norte = direccion == TURNO[NORTH]
+    dentro_n = np.cumsum(delta * norte)
+    dentro_s = np.cumsum(delta * ~norte)
+
+    mal = (inside_n < 0) | (inside_s < 0) | (dentro_n < 0) | (dentro_s < 0)
+    if not separados:
+        mal |= ((inside_n > 0) & (inside_s > 0)) | ((dentro_n > 0) & (dentro_s > 0))
+    for i in range(int(carril.max()) + 1 if carril.size else 0):
+        en_i = carril == i # solo ENTRA y SALE cambian la ocupación
+        carril_n = np.cumsum(delta * (en_i & norte))
+        carril_s = np.cumsum(delta * (en_i & ~norte))
+        mal |= (carril_n > 0) & (carril_s > 0)
+        if capacidad is not None:
+            mal |= carril_n + carril_s > capacidad
+    ini, fin = rachas(mal)
+    t_fin = np.append(t, t[-1] if t.size else 0.0)[fin]
+    intervalos = []
+    for a, b, tb in zip(ini.tolist(), fin.tolist(), t_fin.tolist()):
+        intervalos.append({
+            "inicio": float(t[a]), "fin": tb, "registros": b - a,
+            "max_inside": [int(max(inside_n[a:b].max(), dentro_n[a:b].max())),
+                           int(max(inside_s[a:b].max(), dentro_s[a:b].max()))],
+        })
+    return intervalos
+
+
+def turnos(c):
+    """Duración de cada turno y coches que entran en él, según el campo turno de los registros del monitor."""
+    monitor = c["tipo"] != CREADO
+    t = c.toma("t", monitor)
+    turno = c.toma("turno", monitor)
+    if t.size == 0:
+        return {"n": 0, "duracion": resumen(np.empty(0)), "coches": resumen(np.empty(0))}
+    cambio = np.concatenate(([True], turno[1:] != turno[:-1]))
+    inicio = np.flatnonzero(cambio)
+    duracion = np.diff(np.append(t[inicio], t[-1]))
+    segmento = np.cumsum(cambio) - 1
+    coches = np.bincount(segmento[c["tipo"][monitor] == ENTRA], minlength=inicio.size)
+    res = {"n": int(inicio.size), "duracion": resumen(duracion), "coches": resumen(coches.astype(float))}
+    for direction in (NORTH, SOUTH):
+        suyos = turno[inicio] == TURNO[direction]
+        res[direction] = {"n": int(suyos.sum()), "duracion": resumen(duracion[suyos]),
+                          "coches": resumen(coches[suyos].astype(float))}
+    return res
+
+
+def esperas_largas(instantes, direccion, cota, fin):
+    """Coches cuya espera supera la cota; los que no han entrado cuentan hasta el final de la traza."""
+    quiere, entra = instantes[QUIERE], instantes[ENTRA]
+    espera = np.where(np.isnan(entra), fin - quiere, entra - quiere)
+    largos = np.flatnonzero(espera > cota) # NaN (no llegó a pedir entrar) da False
+    return [{"cid": int(i), "direction": DIRECCIONES[int(direccion[i])], "quiere": float(quiere[i]),
+             "entra": None if np.isnan(entra[i]) else float(entra[i]), "espera": float(espera[i])}
+            for i in largos.tolist()]
+
+
+def analiza(fichero, espera_max=None, escala=1.0, capacidad=None, separados=False):
+    """Calcula todas las métricas de la traza y devuelve un diccionario."""
+    c = Columnas(carga(fichero), escala)
+    fin = float(c["t"][-1]) if c["t"].size else 0.0
+    instantes, direccion = por_coche(c)
+    espera = instantes[ENTRA] - instantes[QUIERE]
+    cruce = instantes[SALE] - instantes[ENTRA]
+    presentes = direccion >= 0
+    res = {
+        "fichero": fichero,
+        "registros": int(c["t"].size),
+        "duracion": fin,
+        "coches": int(presentes.sum()),
+        "servidos": int((~np.isnan(instantes[SALE])).sum()),
+        "sin_entrar": int((~np.isnan(instantes[QUIERE]) & np.isnan(instantes[ENTRA])).sum()),
+        "espera": resumen(espera),
+        "cruce": resumen(cruce),
+        "por_direccion": {},
+        "turnos": turnos(c),
+        "violaciones": violaciones(c, capacidad, separados),
+    }
+    for direction in (NORTH, SOUTH):
+        suyos = direccion == TURNO[direction]
+        res["por_direccion"][direction] = {"coches": int(suyos.sum()), "espera": resumen(espera[suyos]),
+                                           "cruce": resumen(cruce[suyos])}
+    if espera_max is not None:
+        res["espera_max"] = espera_max
+        res["esperas_largas"] = esperas_largas(instantes, direccion, espera_max, fin)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Métricas y comprobación del invariante de una traza del túnel")
+    parser.add_argument("fichero")
+    parser.add_argument("--espera-max", type=float, metavar="SEGUNDOS",
+                        help="señala los coches que esperan más que esto para entrar")
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="escala de tiempo de la ejecución, para dar los tiempos en la escala original")
+    parser.add_argument("--capacidad", type=int, help="señala los carriles con más coches que esto")
+    parser.add_argument("--separados", action="store_true",
+                        help="la ejecución tenía un carril por sentido: los dos sentidos pueden estar dentro a la vez")
+    parser.add_argument("--mostrar", type=int, default=10,
+                        help="intervalos y coches señalados que se muestran en el resumen")
+    parser.add_argument("--salida", help="fichero JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    res = analiza(args.fichero, args.espera_max, args.escala, args.capacidad, args.separados)
+    e, tu = res["espera"], res["turnos"]
+    print(f"{res['registros']} registros, {res['coches']} coches ({res['servidos']} servidos, "
+          f"{res['sin_entrar']} sin entrar) en {res['duracion']:.3f} s", file=sys.stderr)
+    if e["n"]:
+        print(f"espera: p50={e['p50']:.4f} p95={e['p95']:.4f} p99={e['p99']:.4f} max={e['max']:.4f}",
+              file=sys.stderr)
+    if tu["n"]:
+        print(f"turnos: {tu['n']}, duración media {tu['duracion']['media']:.4f} s, "
+              f"{tu['coches']['media']:.2f} coches por turno", file=sys.stderr)
+    print(f"intervalos con el invariante incumplido: {len(res['violaciones'])}", file=sys.stderr)
+    for v in res["violaciones"][:args.mostrar]:
+        print(f"  [{v['inicio']:.6f}, {v['fin']:.6f}] inside={v['max_inside'][0]}/{v['max_inside'][1]}",
+              file=sys.stderr)
+    if args.espera_max is not None:
+        largas = res["esperas_largas"]
+        print(f"coches que esperan más de {args.espera_max:g} s: {len(largas)}", file=sys.stderr)
+        for l in largas[:args.mostrar]:
+            entra = "no entra" if l["entra"] is None else f"entra en {l['entra']:.6f}"
+            print(f"  car {l['cid']} from {l['direction']}: quiere en {l['quiere']:.6f}, {entra} "
+                  f"({l['espera']:.4f} s)", file=sys.stderr)
+
+    texto = json.dumps(res, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+    return 1 if res["violaciones"] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+BARRIDO DE PARÁMETROS de las políticas del túnel
+
+Para elegir TIME (versiones 2 y 3) o MAX (versión 4) sin editar constantes:
+ejecuta con benchmark.ejecuta_caso todas las combinaciones de políticas con
+sus parámetros, tasas de llegada, proporciones de coches del norte y
+semillas, repartidas entre un grupo de procesos, y muestra una tabla de
+coches por segundo frente a la espera p99 de cada punto (la media de sus
+semillas). Con * se marcan los puntos óptimos para cada carga: los que
+ningún otro supera a la vez en coches por segundo y en espera p99.
+
+Las políticas se dan como en benchmark.py, y cada una puede llevar una
+lista de valores separados por comas: tiempo:0.1,0.5,1 son tiempo:0.1,
+tiempo:0.5 y tiempo:1.
+
+Cada resultado se guarda en el directorio de caché (--cache) en un fichero
+cuyo nombre es el hash de su configuración y de la versión del código (el
+contenido de los módulos que intervienen en la ejecución). Al repetir un
+barrido solo se calculan los puntos nuevos, y al cambiar el código se
+vuelven a calcular todos. Con backends reales conviene --procesos 1, para
+que las ejecuciones no compitan entre sí por la CPU.
+
+    python barrido.py --politica tiempo:0.05,0.1,0.5,1 max:1,2,4,8 --tasa 1 2 --seed 0 1 2
+    python barrido.py --politica tiempo-cediendo:0.1,1,5 3 --prob-norte 0.5 0.8 --salida barrido.json
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+import multiprocessing
+
+from benchmark import ejecuta_caso, lee_politica
+from trafico import DISTRIBUCIONES_CRUCE
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Módulos de los que depende el resultado de un caso
+MODULOS = ("monitor.py", "politicas.py", "simulacion.py", "concurrencia.py", "benchmark.py", "traza.py", "trafico.py",
+           "tunelversion1.py", "tunelversion2.py", "tunelversion3.py", "tunelversion4.py")
+
+CACHE = ".barrido"
+
+# Las ejecuciones del barrido van en procesos del grupo, que no pueden crear otros procesos
+BACKENDS = ("sim", "hilos", "asyncio")
+
+POLITICAS = ["tiempo:0.05,0.1,0.5,1,2", "tiempo-cediendo:0.05,0.1,0.5,1,2", "max:1,2,4,8,16"]
+
+
+def expande(texto):
+    """'nombre:a,b,c' -> ['nombre:a', 'nombre:b', 'nombre:c']; el resto, tal cual."""
+    nombre, _, valores = texto.partition(":")
+    if not valores:
+        return [texto]
+    return [f"{nombre}:{v}" for v in valores.split(",")]
+
+
+def version_codigo():
+    h = hashlib.sha256()
+    for nombre in MODULOS:
+        with open(os.path.join(DIRECTORIO, nombre), "rb") as f:
+            h.update(nombre.encode())
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def clave(config, version):
+    texto = json.dumps(config, sort_keys=True)
+    return hashlib.sha256(f"{version}\n{texto}".encode()).hexdigest()
+
+
+def lee_cache(fichero):
+    try:
+        with open(fichero, encoding="utf-8") as f:
+            return json.load(f)["caso"]
+    except (OSError, ValueError, KeyError):
+        return None # no está, o quedó a medias
+
+
+def guarda_cache(fichero, config, version, caso):
+    # se escribe aparte y se renombra, para no dejar nunca un fichero a medias
+    temporal = f"{fichero}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"config": config, "version": version, "caso": caso}, f, ensure_ascii=False)
+    os.replace(temporal, fichero)
+
+
+def calcula(trabajo):
+    # En un proceso del grupo: ejecuta un caso y lo devuelve con su clave
+    k, config = trabajo
+    opciones = dict(config)
+    politica = lee_politica(opciones.pop("politica"))
+    return k, ejecuta_caso(politica, **opciones)
+
+
+def optimos(filas):
+    """Marca las filas que ninguna otra de su misma carga domina en coches/s y p99."""
+    for fila in filas:
+        fila["optimo"] = not any(
+            o is not fila and (o["tasa"], o["prob_norte"]) == (fila["tasa"], fila["prob_norte"])
+            and o["coches_por_segundo"] >= fila["coches_por_segundo"] and o["p99"] <= fila["p99"]
+            and (o["coches_por_segundo"] > fila["coches_por_segundo"] or o["p99"] < fila["p99"])
+            for o in filas)
+
+
+def tabla(casos):
+    """Agrupa los casos por política y carga, con la media de sus semillas."""
+    grupos = {}
+    for caso in casos:
+        grupos.setdefault((caso["politica"], caso["tasa"], caso["prob_norte"]), []).append(caso)
+    filas = []
+    for (politica, tasa, prob), grupo in grupos.items():
+        servidos = [c for c in grupo if c["coches_por_segundo"] is not None and c["espera"]["p99"] is not None]
+        if not servidos:
+            continue
+        filas.append({
+            "politica": politica,
+            "tasa": tasa,
+            "prob_norte": prob,
+            "semillas": len(grupo),
+            "coches_por_segundo": sum(c["coches_por_segundo"] for c in servidos) / len(servidos),
+            "p99": sum(c["espera"]["p99"] for c in servidos) / len(servidos),
+            "p99_max": max(c["espera"]["p99"] for c in servidos),
+            "bloqueados": sum(c["bloqueados"] for c in grupo),
+        })
+    optimos(filas)
+    filas.sort(key=lambda f: (f["tasa"], f["prob_norte"], f["p99"]))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de parámetros de las políticas del túnel")
+    parser.add_argument("--politica", nargs="+", default=POLITICAS,
+                        help="como en benchmark.py; 'nombre:a,b,c' prueba cada valor")
+    parser.add_argument("--tasa", type=float, nargs="+", default=[2.0], help="coches por segundo")
+    parser.add_argument("--prob-norte", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--seed", type=int, nargs="+", default=[0])
+    parser.add_argument("--ncars", type=int, default=10000)
+    parser.add_argument("--cruce", choices=sorted(DISTRIBUCIONES_CRUCE), default="uniforme")
+    parser.add_argument("--cruce-media", type=float, default=1.5)
+    parser.add_argument("--capacidad", type=int, help="coches que caben en cada carril (por defecto, sin límite)")
+    parser.add_argument("--carriles", type=int, default=1)
+    parser.add_argument("--fifo", action="store_true",
+                        help="cada sentido entra en orden de llegada (backends reales; la simulación ya lo hace)")
+    parser.add_argument("--backend", choices=BACKENDS, default="sim")
+    parser.add_argument("--escala", type=float, default=1.0, help="factor de tiempo para los backends reales")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache", default=CACHE, help="directorio de resultados ya calculados")
+    parser.add_argument("--recalcula", action="store_true", help="ignora los resultados de la caché")
+    parser.add_argument("--salida", help="fichero JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+    if args.fifo and args.backend == "sim":
+        parser.error("--fifo solo tiene sentido con --backend real: la simulación ya admite en orden de llegada")
+
+    politicas = [p for texto in args.politica for p in expande(texto)]
+    for texto in politicas: # mejor fallar aquí que en un proceso del grupo
+        lee_politica(texto)
+    version = version_codigo()
+    os.makedirs(args.cache, exist_ok=True)
+
+    casos = {}      # clave -> caso
+    pendientes = [] # (clave, configuración) que hay que calcular
+    orden = []
+    for politica, tasa, prob, seed in itertools.product(politicas, args.tasa, args.prob_norte, args.seed):
+        config = {"politica": politica, "backend": args.backend, "tasa": tasa, "prob_norte": prob,
+                  "cruce": args.cruce, "cruce_media": args.cruce_media, "ncars": args.ncars, "seed": seed,
+                  "escala": args.escala, "capacidad": args.capacidad, "carriles": args.carriles,
+                  "fifo": args.fifo}
+        k = clave(config, version)
+        orden.append(k)
+        caso = None if args.recalcula else lee_cache(os.path.join(args.cache, k + ".json"))
+        if caso is not None:
+            casos[k] = caso
+        elif k not in casos:
+            casos[k] = None
+            pendientes.append((k, config))
+    print(f"{len(orden)} casos: {len(orden) - len(pendientes)} en la caché, {len(pendientes)} por calcular",
+          file=sys.stderr)
+
+    configs = dict(pendientes)
+    if pendientes:
+        with multiprocessing.Pool(min(args.procesos, len(pendientes))) as pool:
+            for i, (k, caso) in enumerate(pool.imap_unordered(calcula, pendientes), 1):
+                # se guarda según llega, para no perderlo si se interrumpe el barrido
+                guarda_cache(os.path.join(args.cache, k + ".json"), configs[k], version, caso)
+                casos[k] = caso
+                print(f"[{i}/{len(pendientes)}] {caso['politica']} tasa={caso['tasa']:g} "
+                      f"norte={caso['prob_norte']:g} seed={caso['seed']}", file=sys.stderr)
+
+    resultados = [casos[k] for k in orden]
+    filas = tabla(resultados)
+    print(f"{'':2}{'política':32} {'tasa':>6} {'norte':>6} {'semillas':>8} {'coches/s':>9} {'p99':>10} "
+          f"{'p99 máx':>10} {'bloqueados':>10}", file=sys.stderr)
+    for f in filas:
+        print(f"{'*' if f['optimo'] else ' ':2}{f['politica']:32} {f['tasa']:6g} {f['prob_norte']:6g} "
+              f"{f['semillas']:8} {f['coches_por_segundo']:9.3f} {f['p99']:10.3f} {f['p99_max']:10.3f} "
+              f"{f['bloqueados']:10}", file=sys.stderr)
+
+    texto = json.dumps({"version": version, "casos": resultados, "tabla": filas}, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+"""
+BENCHMARK de las políticas de turnos del túnel
+
+Ejecuta cada política con la misma carga (tasa de llegadas, proporción de
+coches del norte, distribución del tiempo de cruce y número de coches) y mide:
+
+    - coches por segundo que atraviesan el túnel;
+    - espera desde "wants to enter" hasta "enters the tunnel": p50, p95, p99,
+      p99.9, máximo y media;
+    - número de cambios de turno;
+    - número de coches despertados y cuántos de ellos no pudieron entrar
+      (despertares espurios);
+    - fracción del tiempo en la que el túnel está vacío;
+    - por dirección: coches, espera p99 y máxima y coches que no llegan a
+      entrar nunca (inanición);
+    - por clase de vehículo (normal, servicio, emergencia): coches y
+      percentiles de la espera, para comprobar que los prioritarios cumplen
+      su objetivo;
+    - en los backends reales, el arranque de cada coche: desde que llega
+      hasta que solicita entrar, descontando la espera que le toca, en
+      segundos reales (lo que cuesta crear su proceso o hilo, o esperar a
+      un trabajador libre).
+
+El túnel puede tener capacidad limitada y varios carriles (--capacidad,
+--carriles, --separados; ver monitor.py), para ver cómo interactúa la
+capacidad con cada política. Con --fifo se comparan además las políticas
+con y sin admisión en orden de llegada dentro de cada sentido, para ver
+cómo cambia la cola de la distribución de esperas; solo en los backends
+reales, porque la simulación ya admite en orden de llegada (ver
+simulacion.py). Con --prioridad una
+parte de los coches son vehículos prioritarios (ver monitor.py). Con
+--proceso las llegadas siguen uno de los procesos de trafico.py (ráfagas,
+hora punta), y con --trafico se leen de un fichero grabado.
+
+Por defecto se usa la simulación con reloj virtual (simulacion.py); con
+--backend se puede medir también sobre procesos, trabajadores, hilos o
+asyncio; con --arranque y --trabajadores se elige cómo se crean los procesos
+y cuántos trabajadores hay. Con
+--seccion-critica se mide el coste de entrar y salir del monitor sin
+contención en cada backend, coche a coche o en convoys (--convoy). Los
+resultados se escriben en JSON para poder compararlos entre cambios.
+
+    python benchmark.py --politica 1 2 3 4 --tasa 1 2 --prob-norte 0.5 0.8
+    python benchmark.py --politica max:3 --backend hilos --ncars 500 --escala 0.01
+    python benchmark.py --politica 3 --backend trabajadores --arranque forkserver --tasa 50 --escala 0.01
+    python benchmark.py --tasa 4 --capacidad 2 4 8 --carriles 2
+    python benchmark.py --politica max:2 --backend hilos --escala 0.01 --ncars 2000 --fifo
+    python benchmark.py --politica 3 4 --prioridad emergencia:0.01 servicio:0.04
+    python benchmark.py --politica 2 max:4 --proceso poisson rafagas punta --cruce pareto lognormal
+    python benchmark.py --politica 3 --trafico coches.bin
+    python benchmark.py --seccion-critica 100000
+    python benchmark.py --seccion-critica 100000 --convoy 1 8 --politica 1 max:8
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import itertools
+
+from monitor import NORTH, SOUTH, CLASES
+from politicas import VERSIONES, crea_politica, politica_de_version
+from simulacion import simular, Resultado
+from concurrencia import (BACKENDS, METODOS, TRABAJADORES, crea_backend, llegadas, lee_prioridades,
+                          LLEGADA, QUIERE, ENTRA, SALE)
+from trafico import DISTRIBUCIONES_CRUCE, PROCESOS, crea_proceso, genera, lee
+
+
+def lee_politica(texto):
+    """'1'..'4' es la política de esa versión; 'nombre:param' una de politicas.POLITICAS."""
+    if texto.isdigit():
+        return politica_de_version(int(texto))
+    nombre, _, param = texto.partition(":")
+    if not param:
+        return crea_politica(nombre)
+    return crea_politica(nombre, int(param) if param.isdigit() else float(param))
+
+
+def percentil(ordenados, q):
+    # percentil por rango más cercano sobre una lista ya ordenada
+    if not ordenados:
+        return None
+    k = max(0, math.ceil(q / 100 * len(ordenados)) - 1)
+    return ordenados[k]
+
+
+def resumen_esperas(esperas):
+    esperas = sorted(esperas)
+    return {
+        "p50": percentil(esperas, 50),
+        "p95": percentil(esperas, 95),
+        "p99": percentil(esperas, 99),
+        "p999": percentil(esperas, 99.9),
+        "max": esperas[-1] if esperas else None,
+        "media": sum(esperas) / len(esperas) if esperas else None,
+    }
+
+
+def tiempo_ocupado(intervalos):
+    # longitud de la unión de los intervalos [entra, sale]
+    total = 0.0
+    fin = -math.inf
+    for a, b in sorted(intervalos):
+        if b <= fin:
+            continue
+        total += b - max(a, fin)
+        fin = b
+    return total
+
+
+def metricas(res):
+    n = len(res.direccion)
+    servidos = [i for i in range(n) if res.sale[i] is not None]
+    intervalos = [(res.entra[i], res.sale[i]) for i in servidos]
+    quieren = [t for t in res.quiere if t is not None]
+    inicio = min(quieren) if quieren else 0.0
+    fin = max((b for _, b in intervalos), default=inicio)
+    duracion = fin - inicio
+    por_direccion = {}
+    for direction in (NORTH, SOUTH):
+        indices = [i for i in range(n) if res.direccion[i] == direction]
+        esperas = sorted(res.entra[i] - res.quiere[i] for i in indices if res.entra[i] is not None)
+        por_direccion[direction] = {
+            "coches": len(indices),
+            "bloqueados": sum(1 for i in indices if res.entra[i] is None),
+            "espera_p99": percentil(esperas, 99),
+            "espera_max": esperas[-1] if esperas else None,
+        }
+    por_clase = {}
+    for clase in sorted(set(res.clase)):
+        indices = [i for i in range(n) if res.clase[i] == clase]
+        por_clase[CLASES[clase]] = {
+            "coches": len(indices),
+            "bloqueados": sum(1 for i in indices if res.entra[i] is None),
+            "espera": resumen_esperas(res.entra[i] - res.quiere[i] for i in indices if res.entra[i] is not None),
+        }
+    return {
+        "coches": n,
+        "servidos": len(servidos),
+        "bloqueados": sum(1 for t in res.entra if t is None),
+        "duracion": duracion,
+        "coches_por_segundo": len(servidos) / duracion if duracion > 0 else None,
+        "espera": resumen_esperas(res.entra[i] - res.quiere[i] for i in range(n) if res.entra[i] is not None),
+        "cambios_turno": res.cambios_turno,
+        "despertares": res.despertares,
+        "despertares_espurios": res.despertares_espurios,
+        "fraccion_ociosa": 1 - tiempo_ocupado(intervalos) / duracion if duracion > 0 else None,
+        "por_direccion": por_direccion,
+        "por_clase": por_clase,
+        "arranque": resumen_esperas(res.arranque) if res.arranque else None,
+    }
+
+
+def resultado_real(registro, coches, escala):
+    """Convierte el registro de instantes de un backend real en un Resultado."""
+    res = Resultado()
+    t0 = min((registro[4 * i + LLEGADA] for i in range(len(coches))), default=0.0)
+    for i, (cid, direction, pausa, espera, cruce, clase) in enumerate(coches):
+        instantes = [registro[4 * i + k] for k in (LLEGADA, QUIERE, ENTRA, SALE)]
+        if instantes[QUIERE]: # el arranque, en segundos reales
+            res.arranque.append(instantes[QUIERE] - instantes[LLEGADA] - espera * escala)
+        # 0 significa que el coche no llegó a ese punto; los tiempos se pasan a la escala original
+        llegada, quiere, entra, sale = [(t - t0) / escala if t else None for t in instantes]
+        res.direccion.append(direction)
+        res.clase.append(clase)
+        res.llegada.append(llegada)
+        res.quiere.append(quiere)
+        res.entra.append(entra)
+        res.sale.append(sale if entra is not None else None)
+    return res
+
+
+def ejecuta_caso(politica, backend="sim", tasa=2.0, prob_norte=0.5, cruce="uniforme",
+                 cruce_media=1.5, espera_max=6, ncars=10000, seed=0, escala=1.0, limite=30.0,
+                 capacidad=None, carriles=1, separados=False, fifo=False, prioridades=None,
+                 metodo=None, trabajadores=TRABAJADORES, proceso=None, trafico=None):
+    """
+    Ejecuta una configuración y devuelve un diccionario con la configuración y
+    las métricas. prioridades da la proporción de cada clase de vehículo
+    prioritario ({clase: prob}, ver concurrencia.llegadas); metodo y
+    trabajadores, cómo se crean los procesos en esos backends. Con proceso
+    (uno de trafico.PROCESOS) los coches se generan con trafico.genera, y
+    con trafico se leen de ese fichero en lugar de generarse.
+    """
+    dist = DISTRIBUCIONES_CRUCE[cruce]
+    if trafico is not None:
+        coches = lee(trafico)
+    elif proceso is not None:
+        coches = genera(ncars, crea_proceso(proceso, tasa, prob_norte), seed, espera_max,
+                        lambda r: dist(r, cruce_media), prioridades)
+    else:
+        coches = llegadas(ncars, media=1 / tasa, rng=random.Random(seed), prob_norte=prob_norte,
+                          espera_max=espera_max, cruce=lambda r: dist(r, cruce_media), prioridades=prioridades)
+    if backend == "sim" and fifo:
+        raise ValueError("la simulación ya admite en orden de llegada: "
+                         "fifo solo tiene sentido en los backends reales")
+    tunel = {"capacidad": capacidad, "carriles": carriles, "separados": separados}
+    inicio = time.perf_counter()
+    b = None
+    if backend == "sim":
+        res = simular(politica, coches, **tunel)
+    else:
+        coches = list(coches)
+        b = crea_backend(backend, metodo, trabajadores)
+        monitor = b.monitor(politica, fifo=fifo, **tunel)
+        registro = b.registro(len(coches))
+        b.ejecuta(monitor, coches, escala, verbose=False, registro=registro, limite=limite)
+        res = resultado_real(registro, coches, escala)
+        m = getattr(monitor, "monitor", monitor)
+        res.cambios_turno = int(m.turn_switches.value)
+        res.despertares = int(m.wakeups.value)
+        res.despertares_espurios = int(m.spurious_wakeups.value)
+    segundos = time.perf_counter() - inicio
+    caso = {
+        "politica": repr(politica),
+        "backend": backend,
+        "tasa": tasa,
+        "prob_norte": prob_norte,
+        "cruce": cruce,
+        "cruce_media": cruce_media,
+        "proceso": proceso,
+        "trafico": trafico,
+        "ncars": len(res.llegada),
+        "capacidad": capacidad,
+        "carriles": carriles,
+        "separados": separados,
+        "fifo": fifo,
+        "prioridades": {CLASES[c]: p for c, p in (prioridades or {}).items()},
+        "seed": seed,
+        "escala": escala if backend != "sim" else None,
+        "metodo": getattr(b, "metodo", None),
+        "trabajadores": getattr(b, "trabajadores", None),
+        "arranque_trabajadores": getattr(b, "arranque", None),
+        "segundos_reales": segundos,
+    }
+    caso.update(metricas(res))
+    return caso
+
+
+def mide_seccion_critica(politica, backend, n=100000, convoy=1):
+    """
+    Tiempo medio por coche, en nanosegundos, de un wants_enter seguido de un
+    leaves_tunnel sin contención: el coste de las secciones críticas del
+    monitor con las primitivas del backend. Con convoy > 1 los coches entran
+    y salen en grupos con wants_enter_many y leaves_tunnel_many.
+    """
+    b = crea_backend(backend)
+    monitor = b.monitor(politica)
+    m = getattr(monitor, "monitor", monitor)
+
+    def sentido():
+        # un solo coche cada vez: siempre entra en el sentido que tiene el turno
+        return NORTH if m.puede_entrar(NORTH) else SOUTH
+
+    if backend == "asyncio" and convoy > 1:
+        async def bucle():
+            coches = 0
+            while coches < n:
+                direction = sentido()
+                carriles = await monitor.wants_enter_many(direction, convoy)
+                await monitor.leaves_tunnel_many(direction, len(carriles), carriles=carriles)
+                coches += len(carriles)
+        inicio = time.perf_counter()
+        asyncio.run(bucle())
+    elif backend == "asyncio":
+        async def bucle():
+            for _ in range(n):
+                direction = sentido()
+                await monitor.wants_enter(direction)
+                await monitor.leaves_tunnel(direction)
+        inicio = time.perf_counter()
+        asyncio.run(bucle())
+    elif convoy > 1:
+        inicio = time.perf_counter()
+        coches = 0
+        while coches < n: # con la versión 4 el convoy se parte en grupos de MAX
+            direction = sentido()
+            carriles = monitor.wants_enter_many(direction, convoy)
+            monitor.leaves_tunnel_many(direction, len(carriles), carriles=carriles)
+            coches += len(carriles)
+    else:
+        inicio = time.perf_counter()
+        for _ in range(n):
+            direction = sentido()
+            monitor.wants_enter(direction)
+            monitor.leaves_tunnel(direction)
+    return (time.perf_counter() - inicio) / n * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las políticas de turnos del túnel")
+    parser.add_argument("--politica", nargs="+", default=[str(v) for v in sorted(VERSIONES)],
+                        help="versiones (1-4) o políticas 'nombre:param', p. ej. tiempo:0.1 o max:2")
+    parser.add_argument("--backend", choices=["sim"] + sorted(BACKENDS), default="sim")
+    parser.add_argument("--tasa", type=float, nargs="+", default=[2.0], help="coches por segundo")
+    parser.add_argument("--prob-norte", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--cruce", choices=sorted(DISTRIBUCIONES_CRUCE), nargs="+", default=["uniforme"])
+    parser.add_argument("--cruce-media", type=float, default=1.5)
+    parser.add_argument("--ncars", type=int, nargs="+", default=[10000])
+    parser.add_argument("--proceso", choices=sorted(PROCESOS), nargs="+", default=[None],
+                        help="proceso de llegadas de trafico.py (por defecto, las de concurrencia.llegadas)")
+    parser.add_argument("--trafico", metavar="FICHERO",
+                        help="lee los coches de un fichero grabado (ver trafico.py) en lugar de generarlos")
+    parser.add_argument("--capacidad", type=int, nargs="+", default=[None],
+                        help="coches que caben en cada carril (por defecto, sin límite)")
+    parser.add_argument("--carriles", type=int, default=1)
+    parser.add_argument("--separados", action="store_true", help="la mitad de los carriles para cada sentido")
+    parser.add_argument("--fifo", action="store_true",
+                        help="ejecuta cada caso sin y con admisión en orden de llegada (backends reales)")
+    parser.add_argument("--prioridad", nargs="+", metavar="CLASE:PROB", default=[],
+                        help="proporción de vehículos de cada clase prioritaria (p. ej. emergencia:0.01)")
+    parser.add_argument("--arranque", choices=METODOS,
+                        help="método de arranque de los procesos (por defecto, forkserver con trabajadores)")
+    parser.add_argument("--trabajadores", type=int, default=TRABAJADORES,
+                        help="procesos del backend de trabajadores")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="factor de tiempo para los backends reales")
+    parser.add_argument("--limite", type=float, default=30.0,
+                        help="segundos que se espera a los coches bloqueados en los backends reales")
+    parser.add_argument("--seccion-critica", type=int, metavar="N",
+                        help="mide en su lugar el coste de N entradas y salidas sin contención")
+    parser.add_argument("--convoy", type=int, nargs="+", default=[1],
+                        help="con --seccion-critica, coches que entran y salen juntos")
+    parser.add_argument("--salida", help="fichero JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    if args.fifo and args.backend == "sim":
+        parser.error("--fifo solo tiene sentido con --backend real: la simulación ya admite en orden de llegada")
+    casos = []
+    prioridades = lee_prioridades(args.prioridad)
+    if args.seccion_critica:
+        backends = sorted(BACKENDS) if args.backend == "sim" else [args.backend]
+        for texto, backend, convoy in itertools.product(args.politica, backends, args.convoy):
+            politica = lee_politica(texto)
+            ns = mide_seccion_critica(politica, backend, args.seccion_critica, convoy)
+            casos.append({"politica": repr(politica), "backend": backend, "convoy": convoy,
+                          "n": args.seccion_critica, "ns_por_coche": ns})
+            print(f"{repr(politica):32} {backend:9} convoy={convoy:<4} {ns:10.0f} ns por entrada y salida",
+                  file=sys.stderr)
+        configuraciones = []
+    else:
+        configuraciones = itertools.product(args.politica, args.tasa, args.prob_norte, args.cruce, args.ncars,
+                                            args.capacidad, [False, True] if args.fifo else [False], args.proceso)
+    for texto, tasa, prob, cruce, ncars, capacidad, fifo, proceso in configuraciones:
+        caso = ejecuta_caso(lee_politica(texto), args.backend, tasa, prob, cruce, args.cruce_media,
+                            ncars=ncars, seed=args.seed, escala=args.escala, limite=args.limite,
+                            capacidad=capacidad, carriles=args.carriles, separados=args.separados, fifo=fifo,
+                            prioridades=prioridades, metodo=args.arranque, trabajadores=args.trabajadores,
+                            proceso=proceso, trafico=args.trafico)
+        casos.append(caso)
+        e = caso["espera"]
+        print(f"{caso['politica']:32} tasa={tasa:<5g} norte={prob:<4g} {cruce:11} K={capacidad or '-':<3} "
+              f"{proceso + ' ' if proceso else ''}"
+              f"{'fifo ' if fifo else ''}p999={e['p999'] or 0:10.3f} "
+              f"coches/s={caso['coches_por_segundo'] or 0:7.3f} p99={e['p99'] or 0:10.3f} max={e['max'] or 0:10.3f} "
+              f"turnos={caso['cambios_turno']:6} espurios={caso['despertares_espurios']:5} "
+              f"bloqueados={caso['bloqueados']}", file=sys.stderr)
+        if caso["arranque"]:
+            a = caso["arranque"]
+            print(f"{'':32}   arranque p50={a['p50'] * 1e3:8.3f} ms p99={a['p99'] * 1e3:8.3f} ms "
+                  f"max={a['max'] * 1e3:8.3f} ms", file=sys.stderr)
+        for nombre, clase in caso["por_clase"].items():
+            if nombre != CLASES[0]:
+                print(f"{'':32}   {nombre:10} coches={clase['coches']:<6} "
+                      f"p99={clase['espera']['p99'] or 0:10.3f} max={clase['espera']['max'] or 0:10.3f}",
+                      file=sys.stderr)
+
+    texto = json.dumps(casos, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+
+if __name__ == '__main__':
+    main()
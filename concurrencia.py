@@ -0,0 +1,441 @@
+"""
+BACKENDS DE CONCURRENCIA: procesos, hilos y asyncio
+
+El Monitor del túnel recibe sus primitivas de sincronización (Lock, Condition
+y RawArray para el bloque de estado) al construirse, de modo que cualquier política de turnos puede
+ejecutarse con:
+
+    - procesos: un multiprocessing.Process por coche y memoria compartida,
+      como en el main() original;
+    - trabajadores: un número fijo de procesos que se arrancan una vez y
+      van sacando coches de una cola de llegadas común, cada uno en un hilo;
+    - hilos: un threading.Thread por coche dentro de un único proceso;
+    - asyncio: cada coche es una corrutina y el monitor se usa a través de
+      MonitorAsincrono, que espera con asyncio.Condition.
+
+Con hilos o asyncio no hace falta memoria compartida entre procesos, así que
+el bloque de estado es una lista normal. Con asyncio se pueden tener
+decenas de miles de coches concurrentes en un solo proceso.
+
+Con procesos y trabajadores se puede elegir el método de arranque de los
+procesos (fork, forkserver o spawn). El instante de llegada de cada coche lo
+anota el proceso principal al crearlo, así que en el registro se ve también
+lo que tarda en empezar a ejecutarse (arranque, ver benchmark.py).
+
+Con --metricas el estado del monitor y los histogramas de espera y tenencia
+del mutex y de latencia de admisión se publican por HTTP mientras se
+ejecuta (ver exportador.py).
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import threading
+import multiprocessing
+
+from monitor import Monitor, NORTH, SOUTH, NORMAL, CLASES, VENTANA
+from politicas import VERSIONES, politica_de_version
+from traza import Traza
+from exportador import Metricas, sirve
+
+NCARS = 10
+TRABAJADORES = os.cpu_count() or 4 # procesos del backend de trabajadores
+
+
+def bloque(typecode, n):
+    """Equivalente a multiprocessing.RawArray cuando todos los coches comparten memoria."""
+    return [0] * n
+
+
+# Posiciones de cada instante en el registro de un coche
+LLEGADA, QUIERE, ENTRA, SALE = range(4)
+
+
+class Procesos():
+    """Backend original: un proceso por coche y estado en memoria compartida."""
+    nombre = "procesos"
+
+    def __init__(self, metodo=None):
+        # Método de arranque de los procesos: fork, forkserver o spawn (None: el de la plataforma)
+        self.ctx = multiprocessing.get_context(metodo)
+        self.metodo = self.ctx.get_start_method()
+        self.Lock = self.ctx.Lock
+        self.Condition = self.ctx.Condition
+        self.RawArray = self.ctx.RawArray
+
+    def monitor(self, politica, metricas=None, **kwargs):
+        # con métricas, el mutex y las variables condición miden cuánto se espera y se tiene el mutex
+        primitivas = self if metricas is None else metricas.mide(self)
+        return Monitor(politica, primitivas=primitivas, metricas=metricas, **kwargs)
+
+    def registro(self, ncars):
+        # Cada coche escribe solo en sus casillas, así que no hace falta lock
+        return self.ctx.Array('d', 4 * ncars, lock=False)
+
+    def ejecuta(self, monitor, coches, escala=1.0, verbose=True, registro=None, limite=None):
+        procesos = []
+        for cid, direction, pausa, espera, cruce, clase in coches:
+            anota(registro, cid, LLEGADA)
+            p = self.ctx.Process(target=car_proceso, args=(cid, direction, espera, cruce, monitor,
+                                                           escala, verbose, registro, clase))
+            p.start()
+            procesos.append(p)
+            time.sleep(pausa * escala)
+        fin = None if limite is None else time.monotonic() + limite
+        for p in procesos:
+            p.join(None if fin is None else max(0, fin - time.monotonic()))
+            if p.is_alive(): # sigue esperando a entrar: se da por bloqueado
+                p.terminate()
+                p.join()
+
+
+class Trabajadores(Procesos):
+    """
+    Un número fijo de procesos, arrancados una vez al empezar la ejecución,
+    que sacan los coches de una cola de llegadas común. Cada trabajador
+    ejecuta en un hilo cada coche que saca, así que un coche que espera a
+    entrar no impide a su trabajador atender al siguiente: crear un proceso
+    por coche se sustituye por pasar el coche por la cola y crear un hilo.
+    """
+    nombre = "trabajadores"
+
+    def __init__(self, trabajadores=TRABAJADORES, metodo="forkserver"):
+        super().__init__(metodo)
+        self.trabajadores = trabajadores
+        self.arranque = None # segundos hasta que todos los trabajadores están listos
+
+    def ejecuta(self, monitor, coches, escala=1.0, verbose=True, registro=None, limite=None):
+        cola = self.ctx.SimpleQueue()
+        listos = self.ctx.Semaphore(0)
+        procesos = [self.ctx.Process(target=trabajador, args=(cola, listos, monitor, escala, verbose, registro))
+                    for _ in range(self.trabajadores)]
+        try:
+            inicio = time.monotonic()
+            for p in procesos:
+                p.start()
+            for _ in procesos:
+                listos.acquire()
+            self.arranque = time.monotonic() - inicio
+            for cid, direction, pausa, espera, cruce, clase in coches:
+                anota(registro, cid, LLEGADA)
+                cola.put((cid, direction, espera, cruce, clase))
+                time.sleep(pausa * escala)
+            for _ in procesos: # un aviso de fin para cada trabajador
+                cola.put(None)
+            fin = None if limite is None else time.monotonic() + limite
+            for p in procesos:
+                p.join(None if fin is None else max(0, fin - time.monotonic()))
+        finally:
+            for p in procesos:
+                if p.is_alive(): # con un coche bloqueado, o si la ejecución se ha interrumpido
+                    p.terminate()
+                    p.join()
+            cola.close()
+
+
+class Hilos():
+    """Un hilo por coche dentro de un único proceso."""
+    nombre = "hilos"
+    dinamicas = True # el monitor puede crear variables condición mientras se ejecuta (fifo)
+
+    def __init__(self):
+        self.Lock = threading.Lock
+        self.Condition = threading.Condition
+        self.RawArray = bloque
+
+    def monitor(self, politica, metricas=None, **kwargs):
+        # con métricas, el mutex y las variables condición miden cuánto se espera y se tiene el mutex
+        primitivas = self if metricas is None else metricas.mide(self)
+        return Monitor(politica, primitivas=primitivas, metricas=metricas, **kwargs)
+
+    def registro(self, ncars):
+        return [0.0] * (4 * ncars)
+
+    def ejecuta(self, monitor, coches, escala=1.0, verbose=True, registro=None, limite=None):
+        hilos = []
+        for cid, direction, pausa, espera, cruce, clase in coches:
+            anota(registro, cid, LLEGADA)
+            # daemon para que un coche bloqueado no impida terminar al programa
+            h = threading.Thread(target=car, args=(cid, direction, espera, cruce, monitor,
+                                                   escala, verbose, registro, clase), daemon=True)
+            h.start()
+            hilos.append(h)
+            time.sleep(pausa * escala)
+        fin = None if limite is None else time.monotonic() + limite
+        for h in hilos:
+            h.join(None if fin is None else max(0, fin - time.monotonic()))
+        if monitor.traza is not None:
+            monitor.traza.vuelca()
+
+
+async def espera(cond, timeout):
+    # cond.wait() con límite de tiempo, como threading.Condition.wait: False si vence sin aviso
+    if timeout is None:
+        return await cond.wait()
+    try:
+        return await asyncio.wait_for(cond.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+
+
+class MonitorAsincrono():
+    """
+    Expone wants_enter y leaves_tunnel como corrutinas sobre un Monitor
+    construido con primitivas de asyncio, y también los convoys
+    (wants_enter_many y leaves_tunnel_many). La lógica de admisión es la del
+    propio monitor (solicita_entrar, reintenta, al_despertar, entra y sale).
+    """
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.estado = monitor.estado
+        self.traza = monitor.traza
+
+    async def wants_enter(self, direction, cid=0, prioridad=NORMAL):
+        m = self.monitor
+        inicio = m.inicio()
+        async with m.mutex:
+            ticket = m.solicita_entrar(direction, cid, 1, prioridad)
+            cond = m.condicion(direction, ticket, prioridad)
+            esperando = not m.reintenta(direction, 1, ticket, prioridad)
+            while esperando:
+                avisado = await espera(cond, m.espera(direction)) # False: ha vencido el turno
+                esperando = not m.al_despertar(direction, 1, ticket, prioridad, avisado)
+            return m.entra(direction, cid, prioridad, inicio, ticket)
+
+    async def leaves_tunnel(self, direction, cid=0, carril=0):
+        m = self.monitor
+        async with m.mutex:
+            m.sale(direction, cid, carril)
+
+    async def wants_enter_many(self, direction, n, cid=0):
+        m = self.monitor
+        if m.fifo and n > VENTANA:
+            raise ValueError(f"con fifo un convoy no puede tener más de {VENTANA} coches")
+        carriles = []
+        inicio = m.inicio()
+        async with m.mutex:
+            ticket = m.solicita_entrar(direction, cid, n)
+            cond = m.condicion(direction, ticket)
+            esperando = not m.reintenta(direction, n, ticket)
+            while esperando:
+                avisado = await espera(cond, m.espera(direction)) # False: ha vencido el turno
+                esperando = not m.al_despertar(direction, n, ticket, avisado=avisado)
+            while len(carriles) < n and m.puede_entrar(direction, ticket + len(carriles)):
+                carriles.append(m.entra(direction, cid + len(carriles), inicio=inicio,
+                                        ticket=ticket + len(carriles), avisar=False))
+            if len(carriles) < n:
+                m.retira(direction, n - len(carriles), ticket=ticket + len(carriles))
+            if m.fifo: # se avisa una sola vez por el convoy
+                m.avisa_en_orden(direction)
+        return carriles
+
+    async def leaves_tunnel_many(self, direction, n, cid=0, carriles=None):
+        m = self.monitor
+        async with m.mutex:
+            for i in range(n):
+                m.sale(direction, cid + i, carriles[i] if carriles else 0, avisar=False)
+            m.avisa()
+
+
+class Asyncio():
+    """Cada coche es una corrutina en un único bucle de eventos."""
+    nombre = "asyncio"
+    dinamicas = True # el monitor puede crear variables condición mientras se ejecuta (fifo)
+
+    def __init__(self):
+        self.Lock = asyncio.Lock
+        self.Condition = asyncio.Condition
+        self.RawArray = bloque
+
+    def monitor(self, politica, **kwargs):
+        return MonitorAsincrono(Monitor(politica, primitivas=self, **kwargs))
+
+    def registro(self, ncars):
+        return [0.0] * (4 * ncars)
+
+    def ejecuta(self, monitor, coches, escala=1.0, verbose=True, registro=None, limite=None):
+        asyncio.run(self._ejecuta(monitor, coches, escala, verbose, registro, limite))
+
+    async def _ejecuta(self, monitor, coches, escala, verbose, registro, limite):
+        tareas = []
+        for cid, direction, pausa, espera, cruce, clase in coches:
+            anota(registro, cid, LLEGADA)
+            tareas.append(asyncio.create_task(car_async(cid, direction, espera, cruce, monitor,
+                                                        escala, verbose, registro, clase)))
+            await asyncio.sleep(pausa * escala)
+        terminadas, pendientes = await asyncio.wait(tareas, timeout=limite)
+        for t in pendientes: # coches bloqueados
+            t.cancel()
+        if monitor.traza is not None:
+            monitor.traza.vuelca()
+
+
+BACKENDS = {"procesos": Procesos, "trabajadores": Trabajadores, "hilos": Hilos, "asyncio": Asyncio}
+METODOS = ("fork", "forkserver", "spawn")
+
+
+def crea_backend(nombre, metodo=None, trabajadores=TRABAJADORES):
+    # metodo y trabajadores solo se aplican a los backends de procesos
+    if nombre == "trabajadores":
+        return Trabajadores(trabajadores, metodo or "forkserver")
+    if nombre == "procesos":
+        return Procesos(metodo)
+    return BACKENDS[nombre]()
+
+
+def cruce_uniforme(rng, media=1.5):
+    # delay(3) del main() original: uniforme entre 0 y el doble de la media
+    return rng.random() * 2 * media
+
+
+def llegadas(ncars=NCARS, media=0.5, rng=random, prob_norte=0.5, espera_max=6,
+             cruce=cruce_uniforme, prioridades=None):
+    """
+    Genera los coches como el main() original: (cid, direction, pausa hasta el
+    siguiente coche, espera antes de solicitar entrar, tiempo de cruce, clase).
+    Todos los tiempos se sortean aquí, de modo que con el mismo rng se
+    reproduce la misma carga en cualquier backend y en la simulación.
+    prioridades da la proporción de cada clase prioritaria ({clase: prob});
+    sin ellas todos los coches son normales y no se sortea nada más.
+    """
+    for cid in range(1, ncars + 1):
+        direction = NORTH if rng.random() < prob_norte else SOUTH
+        espera = rng.random() * espera_max
+        pausa = rng.expovariate(1 / media)
+        tiempo = cruce(rng)
+        clase = sortea_clase(rng, prioridades) if prioridades else NORMAL
+        yield cid, direction, pausa, espera, tiempo, clase
+
+
+def sortea_clase(rng, prioridades):
+    """Clase de un coche según las proporciones {clase: prob}; el resto son normales."""
+    p = rng.random()
+    for c, prob in sorted(prioridades.items(), reverse=True):
+        if p < prob:
+            return c
+        p -= prob
+    return NORMAL
+
+
+def lee_prioridades(textos):
+    """Convierte ["emergencia:0.01", "servicio:0.05"] en {clase: proporción}."""
+    prioridades = {}
+    for texto in textos:
+        nombre, _, prob = texto.partition(":")
+        if nombre not in CLASES[1:]:
+            raise ValueError(f"clase desconocida: {nombre} (se admiten {', '.join(CLASES[1:])})")
+        prioridades[CLASES.index(nombre)] = float(prob)
+    return prioridades
+
+
+def anota(registro, cid, evento):
+    if registro is not None:
+        registro[4 * (cid - 1) + evento] = time.monotonic()
+
+
+def car(cid, direction, espera, cruce, monitor, escala=1.0, verbose=True, registro=None, prioridad=NORMAL):
+    if monitor.traza is not None:
+        monitor.traza.creado(cid, direction, monitor)
+    if verbose: print(f"car {cid} direction {direction} created")
+    time.sleep(espera * escala)
+    if verbose: print(f"car {cid} from {direction} wants to enter")
+    anota(registro, cid, QUIERE)
+    carril = monitor.wants_enter(direction, cid, prioridad)
+    anota(registro, cid, ENTRA)
+    if verbose: print(f"car {cid} from {direction} enters the tunnel")
+    time.sleep(cruce * escala)
+    if verbose: print(f"car {cid} from {direction} leaving the tunnel")
+    monitor.leaves_tunnel(direction, cid, carril)
+    anota(registro, cid, SALE)
+    if verbose: print(f"car {cid} from {direction} out of the tunnel")
+
+
+def car_proceso(cid, direction, espera, cruce, monitor, *args):
+    # En el backend de procesos cada coche vuelca su traza al terminar
+    car(cid, direction, espera, cruce, monitor, *args)
+    if monitor.traza is not None:
+        monitor.traza.vuelca()
+
+
+def trabajador(cola, listos, monitor, escala, verbose, registro):
+    # Proceso del backend de trabajadores: lanza un hilo por coche hasta sacar None de
+    # la cola y termina cuando han terminado todos sus coches
+    listos.release()
+    hilos = []
+    while True:
+        coche = cola.get()
+        if coche is None:
+            break
+        cid, direction, espera, cruce, clase = coche
+        h = threading.Thread(target=car_proceso, args=(cid, direction, espera, cruce, monitor,
+                                                       escala, verbose, registro, clase))
+        h.start()
+        hilos.append(h)
+    for h in hilos:
+        h.join()
+
+
+async def car_async(cid, direction, espera, cruce, monitor, escala=1.0, verbose=True, registro=None,
+                    prioridad=NORMAL):
+    if monitor.traza is not None:
+        monitor.traza.creado(cid, direction, monitor)
+    if verbose: print(f"car {cid} direction {direction} created")
+    await asyncio.sleep(espera * escala)
+    if verbose: print(f"car {cid} from {direction} wants to enter")
+    anota(registro, cid, QUIERE)
+    carril = await monitor.wants_enter(direction, cid, prioridad)
+    anota(registro, cid, ENTRA)
+    if verbose: print(f"car {cid} from {direction} enters the tunnel")
+    await asyncio.sleep(cruce * escala)
+    if verbose: print(f"car {cid} from {direction} leaving the tunnel")
+    await monitor.leaves_tunnel(direction, cid, carril)
+    anota(registro, cid, SALE)
+    if verbose: print(f"car {cid} from {direction} out of the tunnel")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Túnel con backends de concurrencia intercambiables")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="procesos")
+    parser.add_argument("--version", type=int, choices=sorted(VERSIONES), default=1)
+    parser.add_argument("--ncars", type=int, default=NCARS)
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="factor que multiplica todos los tiempos de espera")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--quiet", "-q", action="store_true")
+    parser.add_argument("--traza", metavar="FICHERO", help="guarda una traza binaria de la ejecución")
+    parser.add_argument("--capacidad", type=int, help="coches que caben en cada carril (por defecto, sin límite)")
+    parser.add_argument("--carriles", type=int, default=1)
+    parser.add_argument("--separados", action="store_true", help="la mitad de los carriles para cada sentido")
+    parser.add_argument("--fifo", action="store_true", help="cada sentido entra en orden de llegada")
+    parser.add_argument("--prioridad", nargs="+", metavar="CLASE:PROB", default=[],
+                        help="proporción de vehículos de cada clase prioritaria (p. ej. emergencia:0.01)")
+    parser.add_argument("--arranque", choices=METODOS,
+                        help="método de arranque de los procesos (por defecto, forkserver con trabajadores)")
+    parser.add_argument("--trabajadores", type=int, default=TRABAJADORES,
+                        help="procesos del backend de trabajadores")
+    parser.add_argument("--metricas", metavar="HOST:PUERTO",
+                        help="publica las métricas del monitor en http://HOST:PUERTO/metrics (ver exportador.py)")
+    args = parser.parse_args()
+
+    backend = crea_backend(args.backend, args.arranque, args.trabajadores)
+    traza = Traza(args.traza) if args.traza else None
+    metricas = Metricas(backend) if args.metricas else None
+    monitor = backend.monitor(politica_de_version(args.version), traza=traza, capacidad=args.capacidad,
+                              carriles=args.carriles, separados=args.separados, fifo=args.fifo,
+                              metricas=metricas)
+    if metricas is not None:
+        sirve(monitor, metricas, args.metricas)
+    inicio = time.perf_counter()
+    coches = llegadas(args.ncars, rng=random.Random(args.seed), prioridades=lee_prioridades(args.prioridad))
+    backend.ejecuta(monitor, coches, args.escala, not args.quiet)
+    total = time.perf_counter() - inicio
+    print(f"{backend.nombre}, versión {args.version}: {args.ncars} coches en {total:.2f} s "
+          f"({args.ncars / total:.1f} coches/s)")
+    if getattr(backend, "arranque", None) is not None:
+        print(f"{backend.trabajadores} trabajadores ({backend.metodo}) listos en {backend.arranque:.3f} s")
+
+if __name__ == '__main__':
+    main()
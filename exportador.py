@@ -0,0 +1,242 @@
+"""
+EXPORTADOR DE MÉTRICAS del túnel en formato de texto de Prometheus
+
+Publica en http://host:puerto/metrics el estado del monitor mientras se
+ejecuta:
+
+    - coches esperando (la profundidad de la cola), dentro y que han entrado
+      en el turno actual, por sentido, y prioritarios esperando por clase;
+    - coches dentro de cada carril;
+    - turno actual, su edad (segundos desde el último cambio de turno) y
+      número de cambios de turno;
+    - avisos y avisos espurios;
+    - histogramas de la espera para coger el mutex del monitor, del tiempo
+      que se tiene cogido y de la latencia de admisión (desde que el coche
+      pide entrar hasta que entra), por sentido.
+
+Los histogramas (Metricas) viven en un bloque creado con las mismas
+primitivas que el monitor, así que con procesos están en memoria
+compartida. Igual que el bloque de estado, solo se modifican con el mutex
+del monitor cogido: la espera se anota justo después de cogerlo y el tiempo
+que se tiene justo antes de soltarlo o de esperar en una variable
+condición (al volver de wait se empieza a contar otra vez; lo que cuesta
+volver a coger el mutex dentro de wait no se distingue de la propia
+espera). La latencia de admisión la anota Monitor.entra.
+
+Para medir el mutex, el backend construye el monitor con las primitivas de
+Metricas.mide, que envuelven su Lock y sus Condition. En asyncio y en el
+servidor nunca se espera por el mutex, así que solo se mide la admisión.
+
+Leer las métricas no coge el mutex: se copia el bloque de estado y el de los
+histogramas tal como estén. Cada valor se lee entero, pero entre dos
+valores puede haber cambiado el estado, lo que basta para monitorizar.
+
+    python concurrencia.py --backend hilos --ncars 1000 --escala 0.01 --metricas 127.0.0.1:9100
+    python servidor.py sirve --politica 3 --metricas 127.0.0.1:9100
+    curl -s 127.0.0.1:9100/metrics
+"""
+
+import time
+import bisect
+import threading
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from monitor import (NORTH, SOUTH, CLASES, TURNO, WANTS, INSIDE, ENTERED, TURN, TURN_SWITCHES, WAKEUPS,
+                     SPURIOUS_WAKEUPS, POR_CLASE, TURNO_DESDE)
+
+DIRECCION = "127.0.0.1:9100"
+
+# Límites superiores de los intervalos de los histogramas, en segundos (1 us a 100 s)
+LIMITES = tuple(float(f"{m}e{e}") for e in range(-6, 2) for m in (1, 2.5, 5)) + (100.0,)
+
+# Series de histogramas en el bloque de Metricas
+ESPERA_MUTEX = 0
+TENENCIA_MUTEX = 1
+ADMISION = {NORTH: 2, SOUTH: 3}
+SERIES = 4
+TAMANO = len(LIMITES) + 2 # un contador por intervalo, el de +Inf y la suma
+
+
+class Metricas():
+    """Histogramas de latencias del monitor en un bloque de las primitivas dadas."""
+
+    def __init__(self, primitivas=multiprocessing):
+        self.bloque = primitivas.RawArray('d', SERIES * TAMANO)
+
+    def observa(self, serie, segundos):
+        # con el mutex del monitor cogido
+        base = serie * TAMANO
+        self.bloque[base + bisect.bisect_left(LIMITES, segundos)] += 1
+        self.bloque[base + TAMANO - 1] += segundos
+
+    def admision(self, direction, segundos):
+        self.observa(ADMISION[direction], segundos)
+
+    def mide(self, primitivas):
+        """Primitivas como las dadas cuyo mutex anota su espera y su tenencia aquí."""
+        return PrimitivasMedidas(primitivas, self)
+
+    def histograma(self, serie):
+        # (contadores acumulados por intervalo, incluido +Inf, y suma), sin coger el mutex
+        valores = self.bloque[serie * TAMANO:(serie + 1) * TAMANO]
+        acumulados = []
+        total = 0
+        for n in valores[:-1]:
+            total += n
+            acumulados.append(total)
+        return acumulados, valores[-1]
+
+
+class MutexMedido():
+    """Lock que anota cuánto se espera para cogerlo y cuánto se tiene cogido."""
+
+    def __init__(self, lock, metricas):
+        self.lock = lock
+        self.metricas = metricas
+        self.cogido = 0.0 # instante en el que lo cogió quien lo tiene
+
+    def acquire(self, *args):
+        antes = time.perf_counter()
+        cogido = self.lock.acquire(*args)
+        if cogido:
+            self.cogido = time.perf_counter()
+            self.metricas.observa(ESPERA_MUTEX, self.cogido - antes)
+        return cogido
+
+    def release(self):
+        self.metricas.observa(TENENCIA_MUTEX, time.perf_counter() - self.cogido)
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class CondicionMedida():
+    """Variable condición sobre un MutexMedido: esperar en ella suelta el mutex."""
+
+    def __init__(self, condicion, mutex):
+        self.condicion = condicion
+        self.mutex = mutex
+
+    def wait(self, timeout=None):
+        m = self.mutex
+        m.metricas.observa(TENENCIA_MUTEX, time.perf_counter() - m.cogido)
+        avisado = self.condicion.wait(timeout)
+        m.cogido = time.perf_counter()
+        return avisado
+
+    def notify(self, n=1):
+        self.condicion.notify(n)
+
+    def notify_all(self):
+        self.condicion.notify_all()
+
+
+class PrimitivasMedidas():
+    """Lock y Condition de otras primitivas, envueltos para medir el mutex."""
+
+    def __init__(self, primitivas, metricas):
+        self.primitivas = primitivas
+        self.metricas = metricas
+        self.RawArray = primitivas.RawArray
+        self.dinamicas = getattr(primitivas, "dinamicas", False)
+
+    def Lock(self):
+        return MutexMedido(self.primitivas.Lock(), self.metricas)
+
+    def Condition(self, lock):
+        return CondicionMedida(self.primitivas.Condition(lock.lock), lock)
+
+
+def numero(v):
+    return str(int(v)) if v == int(v) else repr(float(v))
+
+
+def texto(monitor, metricas=None):
+    """Las métricas del monitor en formato de texto de Prometheus, sin coger el mutex."""
+    m = getattr(monitor, "monitor", monitor) # MonitorAsincrono
+    e = m.estado[:m.CARRIL + m.carriles] # copia del bloque tal como esté
+    ahora = m.reloj()
+    lineas = []
+
+    def metrica(nombre, tipo, ayuda, valores):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for etiquetas, v in valores:
+            lineas.append(f"{nombre}{etiquetas} {numero(v)}")
+
+    def sentidos(posiciones):
+        return [(f'{{direccion="{d}"}}', e[posiciones[d]]) for d in (NORTH, SOUTH)]
+
+    metrica("tunel_coches_esperando", "gauge", "Coches que esperan a entrar en el túnel.", sentidos(WANTS))
+    metrica("tunel_coches_dentro", "gauge", "Coches dentro del túnel.", sentidos(INSIDE))
+    metrica("tunel_coches_entrados_turno", "gauge", "Coches que han entrado en el turno actual.",
+            sentidos(ENTERED))
+    metrica("tunel_prioritarios_esperando", "gauge", "Vehículos prioritarios que esperan a entrar.",
+            [(f'{{direccion="{d}",clase="{CLASES[c]}"}}', e[POR_CLASE[d] + c - 1])
+             for d in (NORTH, SOUTH) for c in range(1, len(CLASES))])
+    metrica("tunel_carril_coches", "gauge", "Coches dentro de cada carril.",
+            [(f'{{carril="{i}"}}', e[m.CARRIL + i]) for i in range(m.carriles)])
+    metrica("tunel_turno", "gauge", "1 para el sentido que tiene el turno.",
+            [(f'{{direccion="{d}"}}', int(e[TURN] == TURNO[d])) for d in (NORTH, SOUTH)])
+    metrica("tunel_turno_edad_segundos", "gauge", "Segundos desde el último cambio de turno.",
+            [("", max(0.0, ahora - e[TURNO_DESDE]))])
+    metrica("tunel_cambios_turno_total", "counter", "Cambios de turno.", [("", e[TURN_SWITCHES])])
+    metrica("tunel_despertares_total", "counter", "Coches avisados.", [("", e[WAKEUPS])])
+    metrica("tunel_despertares_espurios_total", "counter", "Coches avisados que no pudieron entrar.",
+            [("", e[SPURIOUS_WAKEUPS])])
+
+    def histograma(nombre, ayuda, series):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for etiquetas, serie in series:
+            acumulados, suma = metricas.histograma(serie)
+            for limite, n in zip(LIMITES + (float("inf"),), acumulados):
+                le = "+Inf" if limite == float("inf") else f"{limite:g}"
+                lineas.append(f'{nombre}_bucket{{{etiquetas + "," if etiquetas else ""}le="{le}"}} {numero(n)}')
+            sufijo = f"{{{etiquetas}}}" if etiquetas else ""
+            lineas.append(f"{nombre}_sum{sufijo} {numero(suma)}")
+            lineas.append(f"{nombre}_count{sufijo} {numero(acumulados[-1])}")
+
+    if metricas is not None:
+        histograma("tunel_mutex_espera_segundos", "Espera para coger el mutex del monitor.",
+                   [("", ESPERA_MUTEX)])
+        histograma("tunel_mutex_tenencia_segundos", "Tiempo con el mutex del monitor cogido.",
+                   [("", TENENCIA_MUTEX)])
+        histograma("tunel_admision_segundos", "Desde que un coche pide entrar hasta que entra.",
+                   [(f'direccion="{d}"', ADMISION[d]) for d in (NORTH, SOUTH)])
+    return "\n".join(lineas) + "\n"
+
+
+class Peticion(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = texto(self.server.monitor, self.server.metricas).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass # una línea por cada lectura de las métricas estorba en la salida de los coches
+
+
+def sirve(monitor, metricas=None, direccion=DIRECCION):
+    """Atiende /metrics en host:puerto en un hilo aparte; devuelve el servidor (shutdown() lo para)."""
+    host, _, puerto = direccion.rpartition(":")
+    servidor = ThreadingHTTPServer((host or "127.0.0.1", int(puerto)), Peticion)
+    servidor.daemon_threads = True
+    servidor.monitor = monitor
+    servidor.metricas = metricas
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
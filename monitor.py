@@ -0,0 +1,604 @@
+"""
+MONITOR DEL TÚNEL: núcleo común a todas las versiones
+
+Las cuatro versiones del túnel comparten el mismo monitor: contadores de coches
+dentro, esperando y que han entrado en el turno, el turno actual y el instante
+en el que empezó. Lo único que cambia entre versiones es la política de turnos
+(ver politicas.py): quién puede entrar, qué se anota al entrar y cuándo se
+cambia el turno al salir.
+
+El monitor recibe también sus primitivas de sincronización (multiprocessing
+por defecto, ver concurrencia.py), su reloj (time.monotonic por defecto, un
+reloj virtual en simulacion.py) y, opcionalmente, una traza binaria (traza.py) en
+la que registra las solicitudes, entradas y salidas con el mutex cogido, y
+unas métricas (exportador.py) en las que anota la latencia de admisión de
+cada coche, también con el mutex cogido.
+
+El túnel tiene uno o varios carriles con capacidad para K coches cada uno
+(capacidad=None si no hay límite). Por defecto todos los carriles van en el
+sentido del turno; con separados=True la mitad de los carriles es del norte y
+la otra mitad del sur, los dos sentidos circulan a la vez y la política de
+turnos no interviene. El monitor decide en qué carril entra cada coche
+(wants_enter lo devuelve y leaves_tunnel lo recibe).
+
+El turno no solo cambia cuando sale un coche. Si nadie del sentido del turno
+está dentro ni espera y alguien del otro sí, el turno pasa al otro sentido
+(al salir o al solicitar entrar). Y si la política pone un plazo al turno
+(plazo, en las versiones por tiempo), los coches del otro sentido esperan
+con ese plazo como límite (wait con timeout) y, al vencer, revisan el turno
+(revisa_turno) aunque no haya salido nadie. En la simulación y en el
+servidor, en lugar de esperas con límite se programa un evento.
+
+Un convoy de n coches del mismo sentido puede entrar y salir con una sola
+sección crítica (wants_enter_many y leaves_tunnel_many) en lugar de n.
+
+Con fifo=True los coches de cada sentido entran en orden de llegada: cada
+solicitud recibe un número (TICKET) y cada sentido lleva su cabeza de cola
+(SERVING), el menor número aún no atendido. Sin límite de cupo ni de sitio
+solo entra el número de la cabeza; con límite, los números desde la cabeza
+que quepan en la ventana (el cupo de la política y el sitio en el túnel,
+como mucho VENTANA). Los que llegan después no adelantan aunque encuentren
+sitio. Un número queda atendido cuando su coche entra o deja de esperar
+(retira); como dentro de la ventana pueden atenderse fuera de orden, los
+atendidos por delante de la cabeza se anotan en un anillo de ANILLO
+posiciones por sentido al final del bloque de estado (ATENDIDOS), y la
+cabeza avanza por todos los que ya están atendidos.
+Para despertar justo a esos coches, cada coche espera en una variable
+condición propia de su número, que se crea cuando la necesita y se descarta
+al atenderlo; así cada aviso despierta solo a quien puede entrar. Esto
+requiere primitivas que admitan crear variables condición mientras los
+coches se ejecutan (dinamicas, como las de hilos y asyncio). Con procesos
+no se puede: cada sentido tiene RONDA variables condición fijas y el coche
+con número t espera en la t % RONDA, así que un aviso despierta también a
+los que comparten esa variable.
+
+Cada coche tiene además una clase (CLASES): los vehículos de servicio y de
+emergencia tienen prioridad sobre los normales. Mientras espera un vehículo
+prioritario, no entra nadie de menor clase de ningún sentido, y él entra en
+cuanto el sentido contrario deja el túnel libre, sin respetar el turno ni el
+cupo de la política (TIME, MAX). Al salir un coche, si espera un prioritario
+del sentido contrario, el turno pasa a ese sentido aunque la política no lo
+hubiera cambiado. Los prioritarios no reciben número y esperan en su propia
+variable condición, una por sentido y clase, de modo que entre los que
+esperan entra siempre primero el de mayor clase.
+
+Variables condición:
+    turn: natural \\in {0,1}   (0 turno del norte, 1 turno del sur)
+    north_inside: natural
+    south_inside: natural
+    carril[i]: natural        (coches dentro del carril i)
+
+INVARIANTE:
+    north_inside, south_inside >= 0
+    carril[i] <= K
+    sin separados: north_inside > 0 -> south_inside = 0
+                   south_inside > 0 -> north_inside = 0
+    con separados: en cada carril solo hay coches de su sentido
+"""
+
+import time
+import multiprocessing
+
+SOUTH = "south"
+NORTH = "north"
+
+# Valor de turn que corresponde a cada dirección
+TURNO = {NORTH: 0, SOUTH: 1}
+
+# Posición de cada variable en el bloque de estado del monitor
+WANTS = {NORTH: 0, SOUTH: 1}    # coches de cada sentido esperando a entrar
+INSIDE = {NORTH: 2, SOUTH: 3}   # coches de cada sentido dentro del túnel
+ENTERED = {NORTH: 4, SOUTH: 5}  # coches de cada sentido que han entrado en el turno actual
+NOTIFIED = {NORTH: 6, SOUTH: 7} # coches avisados que aún no han vuelto a comprobar si pueden entrar
+TIME = 8                        # instante en el que empieza el turno (0 si no ha empezado)
+TURN = 9                        # turno actual: TURNO[NORTH] o TURNO[SOUTH]
+TURN_SWITCHES = 10              # número de veces que ha cambiado el turno
+WAKEUPS = 11                    # número total de avisos
+SPURIOUS_WAKEUPS = 12           # avisos tras los que el coche no pudo entrar
+TICKET = {NORTH: 13, SOUTH: 14}       # siguiente número que se da a quien solicita entrar
+SERVING = {NORTH: 15, SOUTH: 16}      # cabeza de la cola: menor número aún no atendido
+NOTIFIED_TO = {NORTH: 17, SOUTH: 18}  # con fifo, se ha avisado a los números menores que este
+PRIORITARIOS = {NORTH: 19, SOUTH: 20} # vehículos prioritarios (clase > NORMAL) esperando a entrar
+POR_CLASE = {NORTH: 21, SOUTH: 23}    # los de clase c esperando, en POR_CLASE[direction] + c - 1
+TURNO_DESDE = 25                # instante del último cambio de turno (para la edad del turno)
+NCAMPOS = 26
+PROPIOS = NCAMPOS               # a partir de aquí, las posiciones que reserva la política (politica.campos)
+
+RONDA = 16 # variables condición por sentido con fifo
+VENTANA = 256 # con fifo, números desde la cabeza que pueden entrar a la vez como mucho
+ANILLO = 2 * VENTANA # con fifo, números por sentido desde la cabeza cuya atención se anota en el bloque
+
+# Clases de vehículo, de menor a mayor prioridad
+CLASES = ("normal", "servicio", "emergencia")
+NORMAL, SERVICIO, EMERGENCIA = range(len(CLASES))
+
+
+def opuesta(direction):
+    return SOUTH if direction == NORTH else NORTH
+
+
+class Campo():
+    """
+    Vista de una posición del bloque de estado con la interfaz de
+    multiprocessing.Value (campo.value), para leer los contadores desde fuera
+    del monitor. Dentro del monitor se indexa el bloque directamente.
+    """
+    __slots__ = ("bloque", "i")
+
+    def __init__(self, bloque, i):
+        self.bloque = bloque
+        self.i = i
+
+    @property
+    def value(self):
+        return self.bloque[self.i]
+
+    @value.setter
+    def value(self, v):
+        self.bloque[self.i] = v
+
+
+class Monitor():
+
+    def __init__(self, politica, primitivas=multiprocessing, reloj=time.monotonic, traza=None,
+                 capacidad=None, carriles=1, separados=False, fifo=False, metricas=None):
+        # Política de turnos que decide la admisión
+        self.politica = politica
+        # Carriles del túnel y coches que caben en cada uno (None: sin límite)
+        if separados and carriles < 2:
+            raise ValueError("con un carril por sentido hacen falta al menos dos carriles")
+        if traza is not None and carriles > traza.carriles: # mejor aquí que con el mutex cogido
+            raise ValueError(f"la traza solo puede registrar {traza.carriles} carriles")
+        self.capacidad = capacidad
+        self.carriles = carriles
+        self.separados = separados
+        if separados:
+            self.carriles_de = {NORTH: range(carriles // 2), SOUTH: range(carriles // 2, carriles)}
+        else:
+            self.carriles_de = {NORTH: range(carriles), SOUTH: range(carriles)}
+        # Admisión en orden de llegada dentro de cada sentido
+        self.fifo = fifo
+        # Traza binaria de eventos (None si no se registra nada)
+        self.traza = traza
+        # Reloj del monitor (time.monotonic en tiempo real, un reloj virtual en simulación)
+        self.reloj = reloj
+        # Histogramas de latencias (None si no se mide nada; ver exportador.py)
+        self.metricas = metricas
+        # Todo el estado compartido en un único bloque sin lock propio: solo se
+        # modifica con el mutex del monitor cogido (posiciones WANTS, INSIDE, ...,
+        # las que necesite la política, los coches dentro de cada carril y,
+        # con fifo, el anillo de números atendidos de cada sentido)
+        self.CARRIL = NCAMPOS + politica.campos
+        self.ATENDIDOS = {NORTH: self.CARRIL + carriles, SOUTH: self.CARRIL + carriles + ANILLO}
+        self.estado = primitivas.RawArray('d', self.CARRIL + carriles + (2 * ANILLO if fifo else 0))
+        self.estado[TURN] = TURNO[NORTH]
+        self.estado[TURNO_DESDE] = reloj()
+        # Vistas con nombre de los contadores
+        self.ncars_north_wants_enter = Campo(self.estado, WANTS[NORTH])
+        self.ncars_south_wants_enter = Campo(self.estado, WANTS[SOUTH])
+        self.ncars_north_inside = Campo(self.estado, INSIDE[NORTH])
+        self.ncars_south_inside = Campo(self.estado, INSIDE[SOUTH])
+        self.ncars_north_entered = Campo(self.estado, ENTERED[NORTH])
+        self.ncars_south_entered = Campo(self.estado, ENTERED[SOUTH])
+        self.ncars_north_notified = Campo(self.estado, NOTIFIED[NORTH])
+        self.ncars_south_notified = Campo(self.estado, NOTIFIED[SOUTH])
+        self.time = Campo(self.estado, TIME)
+        self.turn = Campo(self.estado, TURN)
+        self.turn_switches = Campo(self.estado, TURN_SWITCHES)
+        self.wakeups = Campo(self.estado, WAKEUPS)
+        self.spurious_wakeups = Campo(self.estado, SPURIOUS_WAKEUPS)
+        # Semáforo binario para garantizar la exclusión mutua
+        self.mutex = primitivas.Lock()
+        # Variables condición en las que esperan los coches del norte y los del sur.
+        # Con fifo y primitivas dinámicas, una por número en esperas (se crean
+        # al esperar y se descartan al atender el número); si no, RONDA por
+        # sentido y el coche con número t espera en la t % RONDA
+        self.dinamicas = fifo and getattr(primitivas, "dinamicas", False)
+        if self.dinamicas:
+            self.Condition = primitivas.Condition
+            self.esperas = {NORTH: {}, SOUTH: {}}
+        ronda = RONDA if fifo and not self.dinamicas else 1
+        self.turnosem = {direction: [primitivas.Condition(self.mutex) for _ in range(ronda)]
+                         for direction in (NORTH, SOUTH)}
+        self.turnosem_north = self.turnosem[NORTH][0]
+        self.turnosem_south = self.turnosem[SOUTH][0]
+        # Una variable condición por sentido para cada clase de vehículo prioritario
+        self.prioritarios = {direction: [primitivas.Condition(self.mutex) for _ in CLASES[1:]]
+                             for direction in (NORTH, SOUTH)}
+        # Números atendidos demasiado lejos de la cabeza para el anillo: solo
+        # los retira el servidor, donde el monitor vive en un único proceso
+        self.lejanos = {NORTH: set(), SOUTH: set()}
+
+    def es_turno(self, direction):
+        return self.estado[TURN] == TURNO[direction]
+
+    def cambia_turno(self, direction):
+        # El turno pasa a la dirección dada y se reinicia su tiempo
+        e = self.estado
+        if e[TURN] != TURNO[direction]:
+            e[TURN_SWITCHES] += 1
+            e[TURNO_DESDE] = self.reloj()
+        e[TURN] = TURNO[direction]
+        e[TIME] = 0
+
+    # Dirección que tiene el turno
+    def direccion_turno(self):
+        return NORTH if self.estado[TURN] == TURNO[NORTH] else SOUTH
+
+    # Si nadie del sentido del turno está dentro ni espera y alguien del otro sí, el turno pasa al otro
+    def cede_turno_vacio(self):
+        e = self.estado
+        direction = self.direccion_turno()
+        otra = opuesta(direction)
+        if e[INSIDE[direction]] == 0 and e[WANTS[direction]] == 0 and e[WANTS[otra]] > 0:
+            self.cambia_turno(otra)
+
+    # Cambia el turno sin que haya salido nadie si la política lo pide (ha vencido
+    # su plazo) o si el turno está vacío; si cambia, avisa y devuelve True (con el mutex cogido)
+    def revisa_turno(self):
+        if self.separados:
+            return False
+        e = self.estado
+        turno = e[TURN]
+        self.politica.revisa(self, self.direccion_turno())
+        self.cede_turno_vacio()
+        if e[TURN] == turno:
+            return False
+        self.avisa()
+        return True
+
+    # Instante del reloj en el que vence el turno actual (None si no vence por tiempo)
+    def plazo(self):
+        return None if self.separados else self.politica.plazo(self)
+
+    # Cuánto puede esperar un coche de la dirección dada antes de tener que
+    # revisar el turno (None: hasta que le avisen; 0 si el plazo ya ha vencido,
+    # de modo que wait vuelve enseguida sin aviso y el coche revisa el turno)
+    def espera(self, direction):
+        if self.separados or self.es_turno(direction):
+            return None
+        plazo = self.politica.plazo(self)
+        if plazo is None:
+            return None
+        return max(0.0, plazo - self.reloj())
+
+    def tunel_libre(self):
+        e = self.estado
+        return e[INSIDE[NORTH]] == 0 and e[INSIDE[SOUTH]] == 0
+
+    # Variable condición en la que espera un coche de la dirección dada con ese número
+    # (o, si es prioritario, la de su clase)
+    def condicion(self, direction, ticket=0, prioridad=NORMAL):
+        if prioridad > NORMAL:
+            return self.prioritarios[direction][prioridad - 1]
+        if self.dinamicas:
+            esperas = self.esperas[direction]
+            cond = esperas.get(int(ticket))
+            if cond is None:
+                cond = esperas[int(ticket)] = self.Condition(self.mutex)
+            return cond
+        conds = self.turnosem[direction]
+        return conds[int(ticket) % len(conds)]
+
+    # Clase más alta entre los coches de la dirección dada que esperan a entrar
+    def clase_esperando(self, direction):
+        e = self.estado
+        if e[PRIORITARIOS[direction]] == 0:
+            return NORMAL
+        for clase in range(len(CLASES) - 1, NORMAL, -1):
+            if e[POR_CLASE[direction] + clase - 1] > 0:
+                return clase
+        return NORMAL
+
+    # Carril con sitio en el que entraría un coche de la dirección dada (None si no hay sitio)
+    def carril_libre(self, direction):
+        e = self.estado
+        libre, ocupacion = None, self.capacidad
+        for i in self.carriles_de[direction]:
+            n = e[self.CARRIL + i]
+            if ocupacion is None or n < ocupacion: # el carril menos ocupado
+                libre, ocupacion = i, n
+        return libre
+
+    # Cuántos coches más de la dirección dada caben en el túnel (None si no hay límite)
+    def huecos(self, direction):
+        if self.capacidad is None:
+            return None
+        e = self.estado
+        return sum(self.capacidad - e[self.CARRIL + i] for i in self.carriles_de[direction])
+
+    # Cuántos coches más de la dirección dada pueden entrar ahora según el cupo
+    # de la política y el sitio en el túnel (None si no hay límite)
+    def ventana(self, direction):
+        cupo = None if self.separados else self.politica.cupo(self, direction)
+        huecos = self.huecos(direction)
+        if cupo is None:
+            return huecos
+        return cupo if huecos is None else min(cupo, huecos)
+
+    # Si un coche de la dirección dada (con ese número, si hay fifo, y esa clase)
+    # puede entrar (con el mutex cogido)
+    def puede_entrar(self, direction, ticket=None, prioridad=NORMAL):
+        if self.capacidad is not None and self.carril_libre(direction) is None:
+            return False
+        e = self.estado
+        otra = opuesta(direction)
+        if e[PRIORITARIOS[direction]] or e[PRIORITARIOS[otra]]:
+            # primero entran los de mayor clase, de su sentido y, si comparten carriles, del contrario
+            if self.clase_esperando(direction) > prioridad:
+                return False
+            if not self.separados and self.clase_esperando(otra) > prioridad:
+                return False
+        if prioridad > NORMAL: # sin turno ni cupo: basta con que no haya nadie del otro sentido
+            return self.separados or e[INSIDE[otra]] == 0
+        if not (self.separados or self.politica.puede_entrar(self, direction)):
+            return False
+        if ticket is None or not self.fifo:
+            return True
+        return ticket - e[SERVING[direction]] < self.admitidos(direction)
+
+    # Con fifo, cuántos números desde la cabeza pueden entrar ahora: solo la cabeza
+    # si no hay límite, o los que quepan en la ventana (como mucho VENTANA)
+    def admitidos(self, direction):
+        ventana = self.ventana(direction)
+        return 1 if ventana is None else min(ventana, VENTANA)
+
+    # Anota como atendidos los números ticket, ..., ticket + n - 1 de la dirección
+    # dada y avanza la cabeza por todos los ya atendidos (con el mutex cogido)
+    def atiende(self, direction, ticket=None, n=1):
+        e = self.estado
+        if not self.fifo: # sin fifo los números solo sirven para contar
+            e[SERVING[direction]] += n
+            return
+        cabeza = int(e[SERVING[direction]])
+        anillo = self.ATENDIDOS[direction]
+        lejanos = self.lejanos[direction]
+        ticket = cabeza if ticket is None else int(ticket)
+        for t in range(ticket, ticket + n):
+            if self.dinamicas: # ya no espera nadie con este número
+                self.esperas[direction].pop(t, None)
+            if t - cabeza < ANILLO:
+                e[anillo + t % ANILLO] = t + 1 # t + 1 para distinguirlo de una vuelta anterior
+            else:
+                lejanos.add(t)
+        while e[anillo + cabeza % ANILLO] == cabeza + 1 or cabeza in lejanos:
+            lejanos.discard(cabeza)
+            cabeza += 1
+        e[SERVING[direction]] = cabeza
+
+    # Si el número dado ya está atendido (con fifo, con el mutex cogido)
+    def atendido(self, direction, ticket):
+        e = self.estado
+        ticket = int(ticket)
+        if ticket < e[SERVING[direction]]:
+            return True
+        return (e[self.ATENDIDOS[direction] + ticket % ANILLO] == ticket + 1
+                or ticket in self.lejanos[direction])
+
+    # Registra la solicitud de entrada de n coches de la clase dada, con cids
+    # cid, cid + 1, ..., y devuelve el número del primero (None si son
+    # prioritarios, que no lo necesitan) (con el mutex cogido)
+    def solicita_entrar(self, direction, cid=0, n=1, prioridad=NORMAL):
+        e = self.estado
+        e[WANTS[direction]] += n
+        if prioridad > NORMAL:
+            ticket = None
+            e[PRIORITARIOS[direction]] += n
+            e[POR_CLASE[direction] + prioridad - 1] += n
+        else:
+            ticket = e[TICKET[direction]]
+            e[TICKET[direction]] += n
+        if self.traza is not None:
+            for i in range(n):
+                self.traza.quiere(cid + i, direction, self)
+        return ticket
+
+    # Retira la solicitud de n coches de la clase dada, con números ticket,
+    # ticket + 1, ..., que ya no esperan a entrar (con el mutex cogido)
+    def retira(self, direction, n=1, prioridad=NORMAL, ticket=None):
+        e = self.estado
+        e[WANTS[direction]] -= n
+        if prioridad > NORMAL:
+            e[PRIORITARIOS[direction]] -= n
+            e[POR_CLASE[direction] + prioridad - 1] -= n
+            self.avisa() # los de menor clase ya no esperan por ellos
+        else:
+            self.atiende(direction, ticket, n)
+            if self.fifo: # puede haber avanzado la cabeza
+                self.avisa_en_orden(direction)
+
+    # Entrada efectiva en el túnel, una vez que se cumple puede_entrar; devuelve el carril.
+    # inicio es el instante del reloj en el que el coche pidió entrar, para las métricas,
+    # y ticket su número (con fifo; por defecto, la cabeza de la cola)
+    def entra(self, direction, cid=0, prioridad=NORMAL, inicio=None, ticket=None, avisar=True):
+        # {INV y puede_entrar(direction)}
+        e = self.estado
+        carril = self.carril_libre(direction)
+        e[WANTS[direction]] -= 1
+        if prioridad > NORMAL:
+            e[PRIORITARIOS[direction]] -= 1
+            e[POR_CLASE[direction] + prioridad - 1] -= 1
+        else:
+            self.atiende(direction, ticket)
+        e[INSIDE[direction]] += 1
+        e[ENTERED[direction]] += 1
+        e[self.CARRIL + carril] += 1
+        if not self.separados:
+            if e[TURN] != TURNO[direction]: # políticas sin turnos (v1): el turno es de quien está dentro
+                self.cambia_turno(direction)
+            self.politica.al_entrar(self, direction)
+        if self.traza is not None:
+            self.traza.entra(cid, direction, self, carril)
+        if self.metricas is not None and inicio is not None:
+            self.metricas.admision(direction, self.reloj() - inicio)
+        if avisar and prioridad > NORMAL: # los de menor clase que esperaban por él pueden entrar ya
+            self.avisa()
+        elif avisar and self.fifo: # la cabeza ha podido avanzar: se avisa al siguiente
+            self.avisa_en_orden(direction)
+        # {INV}
+        return carril
+
+    # Salida efectiva del túnel por el carril dado (con el mutex cogido)
+    def sale(self, direction, cid=0, carril=0, avisar=True):
+        e = self.estado
+        e[INSIDE[direction]] -= 1
+        e[self.CARRIL + carril] -= 1
+        if not self.separados:
+            self.politica.al_salir(self, direction)
+            otra = opuesta(direction)
+            # un prioritario del otro sentido termina el turno antes de tiempo
+            if (e[PRIORITARIOS[otra]] and not self.es_turno(otra)
+                    and self.clase_esperando(otra) >= self.clase_esperando(direction)):
+                self.cambia_turno(otra)
+            self.cede_turno_vacio()
+        if self.traza is not None: # con el turno ya actualizado por la política
+            self.traza.sale(cid, direction, self, carril)
+        if avisar:
+            self.avisa()
+
+    # Despierta en cada dirección solo a los coches que pueden entrar (con el mutex cogido)
+    def avisa(self):
+        e = self.estado
+        for direction in (NORTH, SOUTH):
+            if e[PRIORITARIOS[direction]]:
+                # mientras haya prioritarios esperando, los demás de este sentido no pueden
+                # entrar: se les avisa cuando entran o se retiran (entra y retira)
+                clase = self.clase_esperando(direction)
+                if self.puede_entrar(direction, prioridad=clase):
+                    e[WAKEUPS] += 1
+                    self.condicion(direction, prioridad=clase).notify_all()
+                continue
+            if self.fifo:
+                self.avisa_en_orden(direction)
+                continue
+            avisados = e[NOTIFIED[direction]]
+            n = e[WANTS[direction]] - avisados # los que siguen dormidos
+            if n <= 0 or not self.puede_entrar(direction):
+                continue
+            ventana = self.ventana(direction)
+            if ventana is not None:
+                n = min(n, ventana - avisados)
+            if n > 0:
+                n = int(n)
+                e[NOTIFIED[direction]] += n
+                e[WAKEUPS] += n
+                self.condicion(direction).notify(n)
+
+    # Con fifo se despierta, desde la cabeza de la cola, a los números que pueden
+    # entrar y aún no tienen aviso, cada uno en su variable condición
+    def avisa_en_orden(self, direction):
+        e = self.estado
+        if e[WANTS[direction]] <= 0 or not self.puede_entrar(direction):
+            return
+        cabeza = e[SERVING[direction]]
+        hasta = min(e[TICKET[direction]], cabeza + self.admitidos(direction))
+        desde = max(e[NOTIFIED_TO[direction]], cabeza)
+        if hasta <= desde:
+            return
+        e[NOTIFIED_TO[direction]] = hasta
+        for ticket in range(int(desde), int(hasta)):
+            if not self.atendido(direction, ticket): # los atendidos fuera de orden ya no esperan
+                e[WAKEUPS] += 1
+                self.condicion(direction, ticket).notify_all()
+
+    # Un coche (o un convoy) que ya no espera en su variable condición deja de
+    # contar entre los avisados (con el mutex cogido)
+    def descuenta_aviso(self, direction, coches=1, prioridad=NORMAL):
+        e = self.estado
+        if prioridad == NORMAL and not self.fifo and e[NOTIFIED[direction]] > 0:
+            e[NOTIFIED[direction]] -= min(coches, e[NOTIFIED[direction]])
+
+    # Un coche (o un convoy de varios) que vuelve de wait comprueba si puede entrar:
+    # avisado si le han avisado, o no si ha vencido el plazo de su espera, en cuyo
+    # caso además revisa el turno (con el mutex cogido). También sin aviso se le
+    # descuenta de los avisados: el aviso pudo llegar a la vez que el plazo y
+    # contarle, y descontar de más solo puede hacer que sobre algún aviso
+    def al_despertar(self, direction, coches=1, ticket=None, prioridad=NORMAL, avisado=True):
+        e = self.estado
+        self.descuenta_aviso(direction, coches, prioridad)
+        if not avisado:
+            if self.reintenta(direction, coches, ticket, prioridad):
+                return True
+        elif self.puede_entrar(direction, ticket, prioridad):
+            return True
+        else:
+            e[SPURIOUS_WAKEUPS] += 1
+        if self.fifo and prioridad == NORMAL: # vuelve a dormir: habrá que avisarle otra vez
+            e[NOTIFIED_TO[direction]] = min(e[NOTIFIED_TO[direction]], ticket)
+        return False
+
+    # Un coche (o un convoy) que no ha recibido aviso, porque acaba de solicitar
+    # entrar o porque ha vencido el plazo de su espera, comprueba si puede entrar
+    # y, si no, revisa el turno (con el mutex cogido)
+    def reintenta(self, direction, coches=1, ticket=None, prioridad=NORMAL):
+        if self.puede_entrar(direction, ticket, prioridad):
+            return True
+        if not self.revisa_turno():
+            return False
+        self.descuenta_aviso(direction, coches, prioridad) # el aviso de revisa_turno también le cuenta a él
+        return self.puede_entrar(direction, ticket, prioridad)
+
+    # Instante en el que un coche pide entrar, si hay métricas que lo necesitan
+    def inicio(self):
+        return None if self.metricas is None else self.reloj()
+
+    def wants_enter(self, direction, cid=0, prioridad=NORMAL):
+        # {INV}
+        inicio = self.inicio()
+        self.mutex.acquire()
+        ticket = self.solicita_entrar(direction, cid, 1, prioridad)
+        cond = self.condicion(direction, ticket, prioridad)
+        esperando = not self.reintenta(direction, 1, ticket, prioridad)
+        while esperando:
+            avisado = cond.wait(self.espera(direction)) # False: ha vencido el turno sin que saliera nadie
+            esperando = not self.al_despertar(direction, 1, ticket, prioridad, avisado)
+        carril = self.entra(direction, cid, prioridad, inicio, ticket)
+        self.mutex.release()
+        return carril
+
+    def leaves_tunnel(self, direction, cid=0, carril=0):
+        # {INV}
+        self.mutex.acquire()
+        self.sale(direction, cid, carril)
+        self.mutex.release()
+        # {INV}
+
+    def wants_enter_many(self, direction, n, cid=0):
+        """
+        Convoy de n coches (cids cid, cid + 1, ...): espera a que pueda entrar
+        el primero y, en la misma sección crítica, deja entrar a todos los que
+        admita la política (en la versión 4, hasta completar MAX en el turno)
+        y quepan en el túnel. Devuelve los carriles de los que han entrado; el
+        resto del convoy deja de esperar y tiene que volver a solicitarlo.
+        """
+        # {INV}
+        if self.fifo and n > VENTANA:
+            raise ValueError(f"con fifo un convoy no puede tener más de {VENTANA} coches")
+        carriles = []
+        inicio = self.inicio()
+        self.mutex.acquire()
+        ticket = self.solicita_entrar(direction, cid, n)
+        cond = self.condicion(direction, ticket)
+        esperando = not self.reintenta(direction, n, ticket)
+        while esperando:
+            avisado = cond.wait(self.espera(direction)) # False: ha vencido el turno sin que saliera nadie
+            esperando = not self.al_despertar(direction, n, ticket, avisado=avisado)
+        while len(carriles) < n and self.puede_entrar(direction, ticket + len(carriles)):
+            carriles.append(self.entra(direction, cid + len(carriles), inicio=inicio,
+                                       ticket=ticket + len(carriles), avisar=False))
+        if len(carriles) < n:
+            self.retira(direction, n - len(carriles), ticket=ticket + len(carriles))
+        if self.fifo: # se avisa una sola vez por el convoy
+            self.avisa_en_orden(direction)
+        self.mutex.release()
+        return carriles
+
+    def leaves_tunnel_many(self, direction, n, cid=0, carriles=None):
+        # Salen n coches del convoy (con sus carriles) y se avisa una sola vez
+        # {INV}
+        self.mutex.acquire()
+        for i in range(n):
+            self.sale(direction, cid + i, carriles[i] if carriles else 0, avisar=False)
+        self.avisa()
+        self.mutex.release()
+        # {INV}
@@ -0,0 +1,255 @@
+"""
+POLÍTICAS DE TURNOS del túnel
+
+Cada versión del túnel es el mismo Monitor (monitor.py) con una política
+distinta. Una política decide, con el mutex del monitor cogido:
+
+    puede_entrar(m, direction): si un coche de esa dirección puede entrar ya;
+    al_entrar(m, direction):    qué se anota cuando un coche ha entrado;
+    al_salir(m, direction):     si hay que cambiar el turno cuando un coche ha
+                                salido;
+    cupo(m, direction):         cuántos coches más de esa dirección pueden
+                                entrar en el turno actual (None si no hay
+                                límite), para no despertar a más de los que
+                                pueden entrar;
+    plazo(m):                   instante del reloj del monitor en el que
+                                vence el turno actual (None si no vence por
+                                tiempo o aún no ha empezado);
+    revisa(m, direction):       si hay que cambiar el turno de direction sin
+                                que haya salido nadie: cuando vence su plazo
+                                o cuando llega un coche del otro sentido.
+
+Las políticas leen y escriben el bloque de estado del monitor (m.estado) por
+posición (WANTS, INSIDE, ENTERED, TIME); los contadores ya están actualizados
+cuando se llama a al_entrar y a al_salir. Después de al_salir el monitor
+avisa a los coches que esperan en la dirección cuyo predicado se cumple.
+Con plazo y revisa el monitor hace que un turno venza aunque no salga ningún
+coche (ver Monitor.revisa_turno).
+
+Una política no guarda estado propio en sus atributos, porque en el backend
+de procesos cada coche tiene su copia. Si lo necesita, reserva sus propias
+posiciones en el bloque del monitor, a partir de PROPIOS.
+"""
+
+import importlib
+
+from monitor import opuesta, WANTS, INSIDE, ENTERED, TIME, PROPIOS
+
+VERSIONES = {1: "tunelversion1", 2: "tunelversion2", 3: "tunelversion3", 4: "tunelversion4"}
+
+
+class Politica():
+    nombre = "base"
+    campos = 0 # posiciones propias en el bloque de estado del monitor
+
+    def puede_entrar(self, m, direction):
+        return m.estado[INSIDE[opuesta(direction)]] == 0
+
+    def al_entrar(self, m, direction):
+        pass
+
+    def al_salir(self, m, direction):
+        pass
+
+    def cupo(self, m, direction):
+        return None
+
+    def plazo(self, m):
+        return None
+
+    def revisa(self, m, direction):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class DrenarYCambiar(Politica):
+    """
+    Versión 1: pasan todos los coches de un sentido que lo soliciten y, cuando
+    no queda ninguno dentro, pueden entrar los del sentido contrario.
+    """
+    nombre = "drenar"
+
+
+class TurnoPorTiempo(Politica):
+    """
+    Versión 2: cada turno dura como mucho TIME. Cuando un coche sale pasado ese
+    tiempo, el turno pasa al otro sentido, cuyos coches entran en cuanto salen
+    los que quedaban dentro.
+    """
+    nombre = "tiempo"
+
+    def __init__(self, tiempo):
+        self.tiempo = tiempo # tiempo máximo adjudicado a cada turno
+
+    def puede_entrar(self, m, direction):
+        return m.es_turno(direction) and m.estado[INSIDE[opuesta(direction)]] == 0
+
+    def al_entrar(self, m, direction):
+        if m.estado[TIME] == 0: # si no hemos inicializado el tiempo de este turno
+            m.estado[TIME] = m.reloj() # guardamos el tiempo de inicio del turno
+
+    def al_salir(self, m, direction):
+        if m.reloj() - m.estado[TIME] > self.tiempo: # si se supera el tiempo máximo del turno
+            m.cambia_turno(opuesta(direction))
+
+    def plazo(self, m):
+        if m.estado[TIME] == 0: # nadie ha entrado aún en este turno
+            return None
+        return m.estado[TIME] + self.tiempo
+
+    def revisa(self, m, direction):
+        e = m.estado
+        otra = opuesta(direction)
+        if e[TIME] != 0 and m.reloj() - e[TIME] > self.tiempo and e[WANTS[otra]] > 0:
+            m.cambia_turno(otra)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.tiempo!r})"
+
+
+class TurnoPorTiempoCediendo(TurnoPorTiempo):
+    """
+    Versión 3: como la versión 2, pero el turno solo cambia si alguien del otro
+    sentido ha solicitado entrar, y cambia antes de tiempo si nadie más del
+    sentido actual lo ha solicitado.
+    """
+    nombre = "tiempo-cediendo"
+
+    def al_salir(self, m, direction):
+        otra = opuesta(direction)
+        if (m.estado[WANTS[direction]] == 0 or m.reloj() - m.estado[TIME] > self.tiempo) and m.estado[WANTS[otra]] > 0:
+            m.cambia_turno(otra) # para que no sigan entrando más de este sentido
+
+    def revisa(self, m, direction):
+        # la misma regla que al salir, una vez empezado el turno
+        if m.estado[TIME] != 0:
+            self.al_salir(m, direction)
+
+
+class MaxCochesPorTurno(Politica):
+    """
+    Versión 4: en cada turno pasan a lo sumo MAX coches (menos si no tantos
+    lo solicitan) cuando algún coche del otro sentido ha solicitado entrar.
+    """
+    nombre = "max"
+
+    def __init__(self, maximo):
+        self.maximo = maximo # número máximo de coches por turno
+
+    def puede_entrar(self, m, direction):
+        return (m.es_turno(direction) and m.estado[INSIDE[opuesta(direction)]] == 0
+                and m.estado[ENTERED[direction]] < self.maximo)
+
+    def al_salir(self, m, direction):
+        otra = opuesta(direction)
+        # si se llega al número máximo de coches por turno o nadie solicita entrar, se cambia el turno
+        if (m.estado[ENTERED[direction]] == self.maximo or m.estado[WANTS[direction]] == 0) and m.estado[WANTS[otra]] > 0:
+            m.cambia_turno(otra)
+        if m.tunel_libre(): # es cierto para el último del turno que salga
+            m.estado[ENTERED[direction]] = 0 # vuelta a inicializar
+
+    def cupo(self, m, direction):
+        return self.maximo - m.estado[ENTERED[direction]]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.maximo!r})"
+
+
+class TurnoAdaptativo(Politica):
+    """
+    Como la versión 3, pero sin TIME fijo: la duración de cada turno se
+    calcula al empezar el turno a partir de la cola de cada sentido y del
+    tiempo de cruce observado, de modo que los del otro sentido no esperen
+    más de espera_objetivo.
+
+    Los del otro sentido esperan lo que dura el turno más lo que tarda en
+    vaciarse el túnel, que es más o menos un tiempo de cruce c. Por tanto
+    ningún turno dura más de espera_objetivo - c. Ese límite se reparte en
+    proporción a los coches de cada sentido (esperando o dentro) y, como
+    cada cambio de turno cuesta un vaciado del túnel, ningún turno dura
+    menos de c. El turno también se cede antes si nadie más de este sentido
+    lo ha solicitado.
+
+    El tiempo de cruce se mide sin identificar a los coches: cada vez que el
+    túnel se vacía, la suma de (salida - entrada) de los que han pasado
+    dividida entre cuántos son es su cruce medio, que se suaviza con una media
+    exponencial.
+    """
+    nombre = "adaptativo"
+    campos = 4
+    CRUCE = PROPIOS           # media exponencial del tiempo de cruce (0 si aún no hay medidas)
+    SUMA = PROPIOS + 1        # suma de salidas menos entradas desde que el túnel se vació
+    SALIDOS = PROPIOS + 2     # coches que han salido desde que el túnel se vació
+    PRESUPUESTO = PROPIOS + 3 # duración del turno actual
+    ALFA = 0.2                # peso de cada nueva medida del cruce
+
+    def __init__(self, espera_objetivo, cruce_inicial=1.0):
+        self.espera_objetivo = espera_objetivo
+        self.cruce_inicial = cruce_inicial # estimación del cruce hasta la primera medida
+
+    def puede_entrar(self, m, direction):
+        return m.es_turno(direction) and m.estado[INSIDE[opuesta(direction)]] == 0
+
+    def cruce(self, m):
+        return m.estado[self.CRUCE] or self.cruce_inicial
+
+    def presupuesto(self, m, direction):
+        e = m.estado
+        c = self.cruce(m)
+        limite = max(c, self.espera_objetivo - c)
+        propios = e[WANTS[direction]] + e[INSIDE[direction]]
+        otros = e[WANTS[opuesta(direction)]]
+        # con las dos colas iguales el turno dura el límite; el sentido con menos coches, menos
+        return min(limite, max(c, 2 * limite * propios / (propios + otros)))
+
+    def al_entrar(self, m, direction):
+        e = m.estado
+        ahora = m.reloj()
+        e[self.SUMA] -= ahora
+        if e[TIME] == 0: # primer coche del turno
+            e[TIME] = ahora
+            e[self.PRESUPUESTO] = self.presupuesto(m, direction)
+
+    def al_salir(self, m, direction):
+        e = m.estado
+        ahora = m.reloj()
+        e[self.SUMA] += ahora
+        e[self.SALIDOS] += 1
+        if m.tunel_libre(): # han salido todos los que entraron: suma / salidos es su cruce medio
+            medida = e[self.SUMA] / e[self.SALIDOS]
+            e[self.CRUCE] = medida if e[self.CRUCE] == 0 else (1 - self.ALFA) * e[self.CRUCE] + self.ALFA * medida
+            e[self.SUMA] = 0
+            e[self.SALIDOS] = 0
+        otra = opuesta(direction)
+        if (e[WANTS[direction]] == 0 or ahora - e[TIME] > e[self.PRESUPUESTO]) and e[WANTS[otra]] > 0:
+            m.cambia_turno(otra)
+
+    def plazo(self, m):
+        e = m.estado
+        return e[TIME] + e[self.PRESUPUESTO] if e[TIME] != 0 else None
+
+    def revisa(self, m, direction):
+        e = m.estado
+        otra = opuesta(direction)
+        if e[TIME] == 0 or e[WANTS[otra]] == 0:
+            return
+        if e[WANTS[direction]] == 0 or m.reloj() - e[TIME] > e[self.PRESUPUESTO]:
+            m.cambia_turno(otra)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.espera_objetivo!r})"
+
+
+POLITICAS = {p.nombre: p for p in (DrenarYCambiar, TurnoPorTiempo, TurnoPorTiempoCediendo, MaxCochesPorTurno,
+                                   TurnoAdaptativo)}
+
+
+def crea_politica(nombre, *args):
+    return POLITICAS[nombre](*args)
+
+
+def politica_de_version(version):
+    # La política (con sus constantes TIME o MAX) que usa tunelversion<version>.py
+    return importlib.import_module(VERSIONES[version]).politica()
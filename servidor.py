@@ -0,0 +1,460 @@
+"""
+SERVIDOR DEL TÚNEL en un socket local (TCP o Unix)
+
+El Monitor con primitivas de multiprocessing solo sirve para procesos que
+salen del mismo main(). Aquí el monitor vive en un servidor y los coches de
+cualquier proceso (o de otra máquina) lo usan a través de un cliente con la
+misma interfaz: wants_enter(direction, cid, prioridad) devuelve el carril y
+leaves_tunnel(direction, cid) lo libera.
+
+El servidor atiende todas las conexiones en un único bucle de asyncio, así
+que las peticiones ya llegan serializadas y el monitor se construye con las
+primitivas que no bloquean de la simulación: un coche que no puede entrar
+queda en la cola de su dirección, ordenada por clase y orden de llegada, y
+se le responde cuando el monitor lo avisa y puede entrar
+(simulacion.despierta). Si la política pone plazo al turno, el bucle
+programa la revisión del turno para ese instante (call_later).
+
+Protocolo: peticiones y respuestas binarias de tamaño fijo.
+
+    petición:  id, operación (ENTRAR o SALIR), dirección (0 norte, 1 sur),
+               clase del vehículo (monitor.CLASES, solo en ENTRAR), cid
+    respuesta: id, estado (OK o ERROR), carril
+
+El id lo elige el cliente y sirve para emparejar respuestas, que pueden
+llegar en otro orden que las peticiones (un coche que espera no retrasa a
+los demás). Un cliente puede enviar muchas peticiones seguidas sin esperar
+respuesta (pipelining) o varias en un solo envío (lote), y el servidor
+agrupa las respuestas de cada conexión en una sola escritura por vuelta del
+bucle. El cid identifica al coche dentro de su conexión; si la conexión se
+cierra, sus coches dejan de esperar y los que estaban dentro salen. Un
+ENTRAR con el id de otra petición ENTRAR aún sin responder, o de un coche
+que ya está dentro o esperando, recibe ERROR.
+
+    python servidor.py sirve --direccion 127.0.0.1:7000 --politica 3 --capacidad 4
+    python servidor.py sirve --direccion unix:/tmp/tunel.sock
+    python servidor.py sirve --direccion unix:/tmp/tunel.sock --metricas 127.0.0.1:9100
+    python servidor.py carga --direccion unix:/tmp/tunel.sock --conexiones 4 --ventana 64 --segundos 5
+"""
+
+import sys
+import json
+import time
+import random
+import socket
+import signal
+import struct
+import asyncio
+import heapq
+import argparse
+import itertools
+import multiprocessing
+
+from monitor import Monitor, NORTH, SOUTH, TURNO, NORMAL, CLASES
+from simulacion import PrimitivasSimuladas, despierta
+from benchmark import lee_politica, percentil
+from traza import Traza, DIRECCIONES
+from exportador import Metricas, sirve as sirve_metricas
+
+PETICION = struct.Struct("<IBBBxI")  # id, operación, dirección, clase, cid
+RESPUESTA = struct.Struct("<IBBxx")  # id, estado, carril
+
+# Operaciones
+ENTRAR = 0
+SALIR = 1
+
+# Estados de la respuesta
+OK = 0
+ERROR = 1
+
+DIRECCION = "127.0.0.1:7000"
+
+MARGEN = 1e-3 # segundos tras el plazo del turno en los que se revisa
+
+
+def lee_direccion(texto):
+    """'host:puerto' para TCP, 'unix:ruta' para un socket Unix."""
+    if texto.startswith("unix:"):
+        return socket.AF_UNIX, texto[len("unix:"):]
+    host, _, puerto = texto.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(puerto))
+
+
+class Servidor():
+    """Un Monitor compartido por todas las conexiones."""
+
+    def __init__(self, politica, traza=None, metricas=None, **tunel):
+        self.monitor = Monitor(politica, primitivas=PrimitivasSimuladas, traza=traza, metricas=metricas, **tunel)
+        # montículos de (-clase, orden, número, (conexión, id, cid, inicio)) de los que no pueden entrar
+        self.esperando = {NORTH: [], SOUTH: []}
+        self.orden = itertools.count()
+        self.vence = None # plazo del turno para el que ya hay una revisión programada
+        self.peticiones = 0
+
+    def entrar(self, con, pid, direction, cid, clase=NORMAL):
+        m = self.monitor
+        coche = (con, pid, cid, m.inicio())
+        ticket = m.solicita_entrar(direction, cid, 1, clase)
+        if m.reintenta(direction, 1, ticket, clase):
+            self.admite(coche, ticket)
+        else:
+            heapq.heappush(self.esperando[direction], (-clase, next(self.orden), ticket, coche))
+        despierta(m, self.esperando, self.admite)
+        self.programa_vencimiento()
+
+    def admite(self, coche, ticket):
+        con, pid, cid, inicio = coche
+        direction, clase = con.direcciones[pid]
+        carril = self.monitor.entra(direction, cid, clase, inicio, ticket)
+        del con.direcciones[pid]
+        con.esperan.discard(cid)
+        con.dentro[cid] = (direction, carril)
+        con.responde(pid, OK, carril)
+
+    def salir(self, con, pid, direction, cid):
+        coche = con.dentro.get(cid)
+        if coche is None or coche[0] != direction:
+            con.responde(pid, ERROR, 0) # ese coche no está dentro
+            return
+        del con.dentro[cid]
+        self.monitor.sale(direction, cid, coche[1])
+        con.responde(pid, OK, coche[1])
+        despierta(self.monitor, self.esperando, self.admite)
+        self.programa_vencimiento()
+
+    def desconecta(self, con):
+        # Los coches de la conexión que esperaban dejan de pedir entrar y los que estaban dentro salen
+        m = self.monitor
+        for direction in (NORTH, SOUTH):
+            cola = self.esperando[direction]
+            suyos = [(-menos_clase, ticket) for menos_clase, _, ticket, c in cola if c[0] is con]
+            if suyos:
+                cola[:] = [x for x in cola if x[3][0] is not con]
+                heapq.heapify(cola)
+                for clase, ticket in suyos:
+                    m.retira(direction, 1, clase, ticket)
+        for cid, (direction, carril) in con.dentro.items():
+            m.sale(direction, cid, carril)
+        con.dentro.clear()
+        despierta(m, self.esperando, self.admite)
+        self.programa_vencimiento()
+
+    def programa_vencimiento(self):
+        # Si hay coches esperando, el turno se revisa en cuanto vence su plazo
+        plazo = self.monitor.plazo()
+        if plazo is None or plazo == self.vence or not (self.esperando[NORTH] or self.esperando[SOUTH]):
+            return
+        self.vence = plazo
+        espera = max(0.0, plazo - self.monitor.reloj()) + MARGEN
+        asyncio.get_running_loop().call_later(espera, self.vence_turno)
+
+    def vence_turno(self):
+        if self.monitor.revisa_turno():
+            despierta(self.monitor, self.esperando, self.admite)
+        self.programa_vencimiento()
+
+
+class Conexion(asyncio.Protocol):
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.pendiente = b""
+        self.salida = bytearray()
+        self.transporte = None
+        self.direcciones = {} # (dirección, clase) de cada petición ENTRAR sin responder
+        self.esperan = set()  # cids de esas peticiones
+        self.dentro = {}      # cid -> (dirección, carril) de los coches dentro del túnel
+
+    def connection_made(self, transporte):
+        self.transporte = transporte
+
+    def data_received(self, datos):
+        datos = self.pendiente + datos
+        completos = len(datos) - len(datos) % PETICION.size
+        self.pendiente = datos[completos:]
+        s = self.servidor
+        for pid, op, d, clase, cid in PETICION.iter_unpack(memoryview(datos)[:completos]):
+            s.peticiones += 1
+            direction = DIRECCIONES.get(d)
+            if direction is None or clase >= len(CLASES):
+                self.responde(pid, ERROR, 0)
+            elif op == ENTRAR:
+                if pid in self.direcciones or cid in self.dentro or cid in self.esperan:
+                    # id sin responder o coche que ya está dentro o esperando: el monitor no se toca
+                    self.responde(pid, ERROR, 0)
+                    continue
+                self.direcciones[pid] = (direction, clase)
+                self.esperan.add(cid)
+                s.entrar(self, pid, direction, cid, clase)
+            elif op == SALIR:
+                s.salir(self, pid, direction, cid)
+            else:
+                self.responde(pid, ERROR, 0)
+
+    def responde(self, pid, estado, carril):
+        if not self.salida: # primera respuesta de esta vuelta del bucle: se envía al final
+            asyncio.get_running_loop().call_soon(self.envia)
+        self.salida += RESPUESTA.pack(pid, estado, carril)
+
+    def envia(self):
+        if self.salida and not self.transporte.is_closing():
+            self.transporte.write(bytes(self.salida))
+        self.salida.clear()
+
+    def connection_lost(self, exc):
+        self.servidor.desconecta(self)
+
+
+async def sirve(servidor, direccion):
+    familia, donde = lee_direccion(direccion)
+    bucle = asyncio.get_running_loop()
+    if familia == socket.AF_UNIX:
+        srv = await bucle.create_unix_server(lambda: Conexion(servidor), donde)
+    else:
+        srv = await bucle.create_server(lambda: Conexion(servidor), *donde)
+    parar = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        bucle.add_signal_handler(sig, parar.set)
+    async with srv:
+        await parar.wait()
+
+
+class Cliente():
+    """
+    Cliente síncrono: wants_enter y leaves_tunnel esperan su respuesta, y
+    lote envía varias peticiones de una vez y espera todas. En un lote no
+    debe haber un ENTRAR que solo pueda atenderse después de un SALIR que
+    viene detrás en el mismo lote de otra conexión que espera a este.
+    """
+
+    def __init__(self, direccion=DIRECCION):
+        familia, donde = lee_direccion(direccion)
+        self.sock = socket.socket(familia, socket.SOCK_STREAM)
+        self.sock.connect(donde)
+        if familia == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.siguiente = 0
+        self.recibidas = {} # respuestas que han llegado antes que la que se espera
+        self.pendiente = b""
+
+    def _envia(self, peticiones):
+        ids = []
+        datos = bytearray()
+        for op, direction, cid, *clase in peticiones:
+            self.siguiente += 1
+            ids.append(self.siguiente)
+            datos += PETICION.pack(self.siguiente, op, TURNO[direction], clase[0] if clase else NORMAL, cid)
+        self.sock.sendall(datos)
+        return ids
+
+    def _recibe(self, pid):
+        while pid not in self.recibidas:
+            datos = self.pendiente + self.sock.recv(65536)
+            if len(datos) == len(self.pendiente):
+                raise ConnectionError("el servidor ha cerrado la conexión")
+            completos = len(datos) - len(datos) % RESPUESTA.size
+            self.pendiente = datos[completos:]
+            for r, estado, carril in RESPUESTA.iter_unpack(datos[:completos]):
+                self.recibidas[r] = (estado, carril)
+        estado, carril = self.recibidas.pop(pid)
+        if estado != OK:
+            raise ValueError(f"el servidor ha rechazado la petición {pid}")
+        return carril
+
+    def lote(self, peticiones):
+        """
+        Envía [(ENTRAR o SALIR, direction, cid[, clase]), ...] en un solo envío y
+        devuelve los carriles.
+        """
+        return [self._recibe(pid) for pid in self._envia(peticiones)]
+
+    def wants_enter(self, direction, cid=0, prioridad=NORMAL):
+        return self.lote([(ENTRAR, direction, cid, prioridad)])[0]
+
+    def leaves_tunnel(self, direction, cid=0):
+        self.lote([(SALIR, direction, cid)])
+
+    def close(self):
+        self.sock.close()
+
+
+class ClienteAsincrono(asyncio.Protocol):
+    """
+    Cliente para asyncio: muchas corrutinas comparten la conexión y sus
+    peticiones se envían juntas en cada vuelta del bucle (pipelining).
+    """
+
+    def __init__(self):
+        self.transporte = None
+        self.siguiente = 0
+        self.futuros = {}
+        self.salida = bytearray()
+        self.pendiente = b""
+
+    @classmethod
+    async def conecta(cls, direccion=DIRECCION):
+        familia, donde = lee_direccion(direccion)
+        bucle = asyncio.get_running_loop()
+        if familia == socket.AF_UNIX:
+            _, cliente = await bucle.create_unix_connection(cls, donde)
+        else:
+            _, cliente = await bucle.create_connection(cls, *donde)
+        return cliente
+
+    def connection_made(self, transporte):
+        self.transporte = transporte
+
+    def data_received(self, datos):
+        datos = self.pendiente + datos
+        completos = len(datos) - len(datos) % RESPUESTA.size
+        self.pendiente = datos[completos:]
+        for pid, estado, carril in RESPUESTA.iter_unpack(memoryview(datos)[:completos]):
+            futuro = self.futuros.pop(pid)
+            if estado == OK:
+                futuro.set_result(carril)
+            else:
+                futuro.set_exception(ValueError(f"el servidor ha rechazado la petición {pid}"))
+
+    def connection_lost(self, exc):
+        for futuro in self.futuros.values():
+            if not futuro.done():
+                futuro.set_exception(ConnectionError("el servidor ha cerrado la conexión"))
+        self.futuros.clear()
+
+    def _pide(self, op, direction, cid, clase=NORMAL):
+        self.siguiente += 1
+        futuro = asyncio.get_running_loop().create_future()
+        self.futuros[self.siguiente] = futuro
+        if not self.salida:
+            asyncio.get_running_loop().call_soon(self._envia)
+        self.salida += PETICION.pack(self.siguiente, op, TURNO[direction], clase, cid)
+        return futuro
+
+    def _envia(self):
+        if self.salida and not self.transporte.is_closing():
+            self.transporte.write(bytes(self.salida))
+        self.salida.clear()
+
+    async def wants_enter(self, direction, cid=0, prioridad=NORMAL):
+        return await self._pide(ENTRAR, direction, cid, prioridad)
+
+    async def leaves_tunnel(self, direction, cid=0):
+        await self._pide(SALIR, direction, cid)
+
+    def close(self):
+        self.transporte.close()
+
+
+async def _genera(direccion, conexiones, ventana, segundos, cruce, prob_norte, seed):
+    # ventana coches por conexión entrando y saliendo sin parar durante segundos
+    rng = random.Random(seed)
+    clientes = [await ClienteAsincrono.conecta(direccion) for _ in range(conexiones)]
+    latencias = []
+    fin = time.perf_counter() + segundos
+
+    async def coche(cliente, cid):
+        while time.perf_counter() < fin:
+            direction = NORTH if rng.random() < prob_norte else SOUTH
+            t0 = time.perf_counter()
+            await cliente.wants_enter(direction, cid)
+            t1 = time.perf_counter()
+            if cruce:
+                await asyncio.sleep(cruce)
+            await cliente.leaves_tunnel(direction, cid)
+            latencias.append(t1 - t0)
+            latencias.append(time.perf_counter() - t1 - cruce)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(coche(c, cid) for c in clientes for cid in range(ventana)))
+    total = time.perf_counter() - inicio
+    for c in clientes:
+        c.close()
+    return len(latencias), total, latencias
+
+
+def genera(args):
+    return asyncio.run(_genera(*args))
+
+
+def carga(direccion=DIRECCION, procesos=1, conexiones=1, ventana=1, segundos=5.0, cruce=0.0,
+          prob_norte=0.5, seed=0):
+    """
+    Generador de carga: procesos x conexiones x ventana coches concurrentes.
+    Devuelve peticiones por segundo y percentiles de la latencia de cada
+    petición (de ENTRAR hasta que se puede entrar, de SALIR hasta su respuesta).
+    """
+    trabajos = [(direccion, conexiones, ventana, segundos, cruce, prob_norte, seed + i) for i in range(procesos)]
+    if procesos == 1:
+        resultados = [genera(trabajos[0])]
+    else:
+        with multiprocessing.Pool(procesos) as pool:
+            resultados = pool.map(genera, trabajos)
+    peticiones = sum(n for n, _, _ in resultados)
+    duracion = max(t for _, t, _ in resultados)
+    latencias = sorted(l for _, _, ls in resultados for l in ls)
+    return {
+        "direccion": direccion, "procesos": procesos, "conexiones": conexiones, "ventana": ventana,
+        "segundos": duracion, "cruce": cruce, "peticiones": peticiones,
+        "peticiones_por_segundo": peticiones / duracion if duracion > 0 else None,
+        "latencia_us": {"p50": percentil(latencias, 50) * 1e6 if latencias else None,
+                        "p99": percentil(latencias, 99) * 1e6 if latencias else None,
+                        "max": latencias[-1] * 1e6 if latencias else None},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor del túnel como servicio en un socket local")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+
+    p = ordenes.add_parser("sirve", help="arranca el servidor")
+    p.add_argument("--direccion", default=DIRECCION, help="host:puerto o unix:ruta")
+    p.add_argument("--politica", default="1", help="versión (1-4) o 'nombre:param', como en benchmark.py")
+    p.add_argument("--capacidad", type=int, help="coches que caben en cada carril (por defecto, sin límite)")
+    p.add_argument("--carriles", type=int, default=1)
+    p.add_argument("--separados", action="store_true", help="la mitad de los carriles para cada sentido")
+    p.add_argument("--fifo", action="store_true", help="cada sentido entra en orden de llegada")
+    p.add_argument("--traza", metavar="FICHERO", help="guarda una traza binaria del servidor")
+    p.add_argument("--metricas", metavar="HOST:PUERTO",
+                   help="publica las métricas del monitor en http://HOST:PUERTO/metrics (ver exportador.py)")
+
+    p = ordenes.add_parser("carga", help="generador de carga contra un servidor")
+    p.add_argument("--direccion", default=DIRECCION, help="host:puerto o unix:ruta")
+    p.add_argument("--procesos", type=int, default=1)
+    p.add_argument("--conexiones", type=int, default=1, help="conexiones por proceso")
+    p.add_argument("--ventana", type=int, default=1, help="coches concurrentes por conexión")
+    p.add_argument("--segundos", type=float, default=5.0)
+    p.add_argument("--cruce", type=float, default=0.0, help="segundos dentro del túnel")
+    p.add_argument("--prob-norte", type=float, default=0.5)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--salida", help="fichero JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    if args.orden == "sirve":
+        traza = Traza(args.traza) if args.traza else None
+        metricas = Metricas(PrimitivasSimuladas) if args.metricas else None
+        servidor = Servidor(lee_politica(args.politica), traza=traza, metricas=metricas, capacidad=args.capacidad,
+                            carriles=args.carriles, separados=args.separados, fifo=args.fifo)
+        print(f"{servidor.monitor.politica!r} en {args.direccion}", file=sys.stderr)
+        if metricas is not None:
+            sirve_metricas(servidor.monitor, metricas, args.metricas)
+            print(f"métricas en http://{args.metricas}/metrics", file=sys.stderr)
+        asyncio.run(sirve(servidor, args.direccion))
+        if traza is not None:
+            traza.vuelca()
+        print(f"{servidor.peticiones} peticiones atendidas", file=sys.stderr)
+    else:
+        res = carga(args.direccion, args.procesos, args.conexiones, args.ventana, args.segundos,
+                    args.cruce, args.prob_norte, args.seed)
+        lat = res["latencia_us"]
+        print(f"{res['peticiones']} peticiones en {res['segundos']:.2f} s: "
+              f"{res['peticiones_por_segundo']:.0f} peticiones/s, latencia p50={lat['p50']:.0f} us "
+              f"p99={lat['p99']:.0f} us", file=sys.stderr)
+        texto = json.dumps(res, indent=2, ensure_ascii=False)
+        if args.salida:
+            with open(args.salida, "w", encoding="utf-8") as f:
+                f.write(texto + "\n")
+        else:
+            print(texto)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+SIMULACIÓN: Túnel de Kiyotaki con reloj virtual
+
+Simulación de eventos discretos de cualquiera de las cuatro versiones del túnel.
+En lugar de lanzar un proceso por coche y dormir con time.sleep, los coches son
+eventos en un montículo ordenado por un reloj virtual, y la admisión la decide
+el propio Monitor con la política de la versión elegida (solicita_entrar,
+puede_entrar, entra y leaves_tunnel), construido con primitivas simuladas que
+nunca bloquean.
+
+Cuando un coche no puede entrar queda en la cola de espera de su dirección,
+ordenada por clase (los vehículos prioritarios primero) y por orden de
+llegada. Cuando el monitor avisa a los coches de esa dirección, los primeros
+de la cola vuelven a comprobar si pueden entrar (al_despertar), igual que
+harían en la ejecución real al despertar de wait().
+Si la política pone plazo al turno, se programa un evento para ese instante
+en el que el monitor revisa el turno (revisa_turno), como harían los coches
+que esperan con límite de tiempo.
+Así se pueden reproducir millones de coches en segundos y, para una semilla
+dada, el orden de admisión es siempre el mismo.
+
+Como la cola de cada dirección ya está ordenada por llegada y solo entran
+sus primeros coches, la simulación admite dentro de cada clase en orden de
+llegada con cualquier política; la admisión fifo del monitor (ver
+monitor.py) solo cambia algo en las ejecuciones reales, así que aquí no se
+ofrece.
+"""
+
+import math
+import time
+import heapq
+import random
+import argparse
+import itertools
+
+from monitor import Monitor, NORTH, SOUTH, NOTIFIED, NOTIFIED_TO, SERVING, NORMAL, CLASES
+from politicas import VERSIONES, politica_de_version
+from concurrencia import llegadas, lee_prioridades, bloque
+from traza import Traza
+from trafico import PROCESOS, crea_proceso, genera, lee
+
+NCARS = 10
+
+# Tipos de evento
+LLEGA = 0   # el coche se crea
+QUIERE = 1  # el coche solicita entrar en el túnel
+SALE = 2    # el coche sale del túnel
+VENCE = 3   # vence el plazo del turno (Monitor.plazo)
+
+
+class RelojVirtual():
+    """Reloj que solo avanza cuando el simulador procesa un evento."""
+
+    def __init__(self, inicio=0.0):
+        self.ahora = inicio
+
+    def __call__(self):
+        return self.ahora
+
+
+class CerrojoSimulado():
+    """Lock que no bloquea: en la simulación solo hay un hilo de ejecución."""
+
+    def acquire(self, block=True, timeout=None):
+        return True
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class CondicionSimulada():
+    """Variable condición que anota los avisos en lugar de despertar a nadie."""
+
+    def __init__(self, lock=None):
+        self.avisos = 0
+
+    def notify(self, n=1):
+        self.avisos += n
+
+    def notify_all(self):
+        self.avisos += 1
+
+    def wait(self, timeout=None):
+        # El simulador nunca llama a wants_enter: las esperas las gestiona él
+        raise RuntimeError("en la simulación no se puede esperar en una variable condición")
+
+    def wait_for(self, predicate, timeout=None):
+        # El simulador nunca llama a wants_enter: las esperas las gestiona él
+        raise RuntimeError("en la simulación no se puede esperar en una variable condición")
+
+
+class PrimitivasSimuladas():
+    """Sustituye al módulo multiprocessing como origen de Lock, Condition y RawArray."""
+    Lock = CerrojoSimulado
+    Condition = CondicionSimulada
+    RawArray = staticmethod(bloque)
+
+
+class Resultado():
+    """Instantes de cada coche (índice = cid - 1) y orden de admisión."""
+
+    def __init__(self):
+        self.direccion = []
+        self.clase = []
+        self.llegada = []
+        self.quiere = []
+        self.entra = []
+        self.sale = []
+        self.orden = []     # cids en el orden en el que entran al túnel
+        self.arranque = []  # solo en backends reales: de la llegada a "wants to enter" sin la espera del coche
+        self.duracion = 0.0 # instante virtual del último evento
+        self.cambios_turno = 0
+        self.despertares = 0
+        self.despertares_espurios = 0
+
+    def bloqueados(self):
+        # coches que solicitaron entrar pero nunca llegaron a hacerlo
+        return [cid + 1 for cid, t in enumerate(self.entra) if t is None]
+
+    def espera_media(self, clase=None):
+        # de todos los coches o solo de los de una clase
+        esperas = [e - q for q, e, c in zip(self.quiere, self.entra, self.clase)
+                   if e is not None and clase in (None, c)]
+        return sum(esperas) / len(esperas) if esperas else 0.0
+
+
+def despierta(monitor, esperando, admite):
+    """
+    Los coches avisados reevalúan su predicado. esperando tiene un montículo
+    por dirección de (-clase, orden de llegada, número, coche), con el número
+    que devuelve solicita_entrar, de modo que el primero es el de mayor clase
+    y, dentro de la clase, el que antes lo solicitó; admite(coche, número)
+    deja entrar al coche. Tras un aviso en una dirección entran sus primeros
+    coches mientras puedan; como todos vuelven a comprobarlo a la vez, al
+    terminar no queda ningún avisado pendiente de hacerlo.
+    """
+    e = monitor.estado
+    for direction in (NORTH, SOUTH):
+        cola = esperando[direction]
+        conds = monitor.turnosem[direction] + monitor.prioritarios[direction]
+        if any(c.avisos for c in conds):
+            while cola:
+                menos_clase, _, ticket, coche = cola[0]
+                if not monitor.puede_entrar(direction, ticket, -menos_clase):
+                    break # vuelve a dormir en su sitio
+                heapq.heappop(cola)
+                admite(coche, ticket)
+            e[NOTIFIED[direction]] = 0
+            e[NOTIFIED_TO[direction]] = e[SERVING[direction]]
+        for c in conds:
+            c.avisos = 0
+
+
+def simular(politica, coches, verbose=False, traza=None, capacidad=None, carriles=1, separados=False):
+    """
+    Simula con la política de turnos dada los coches que genera el iterable
+    coches, con el formato de concurrencia.llegadas: (cid, direction, pausa
+    hasta el siguiente coche, espera antes de solicitar entrar, tiempo de
+    cruce, clase). Los coches se leen de uno en uno, según van llegando. Si se da
+    un fichero de traza, se guarda en él la traza binaria con los instantes
+    virtuales. capacidad, carriles y separados describen el túnel.
+    """
+    reloj = RelojVirtual()
+    if traza is not None:
+        traza = Traza(traza, reloj=reloj)
+    monitor = Monitor(politica, primitivas=PrimitivasSimuladas, reloj=reloj, traza=traza,
+                      capacidad=capacidad, carriles=carriles, separados=separados)
+    res = Resultado()
+    esperando = {NORTH: [], SOUTH: []} # montículos de (-clase, orden, número, cid)
+    orden = itertools.count()
+    cruces = {} # tiempo de cruce de los coches que aún no han entrado
+    carril = {} # carril de los coches que están dentro
+    eventos = [] # montículo de (instante, secuencia, tipo, cid)
+    seq = 0
+    vence = None # plazo del turno para el que ya hay un evento VENCE
+    coches = iter(coches)
+
+    def programa(t, tipo, cid):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(eventos, (t, seq, tipo, cid))
+
+    def log(cid, texto):
+        if verbose:
+            print(f"[{reloj.ahora:10.4f}] car {cid} {texto}")
+
+    def siguiente(t):
+        # Programa la llegada del siguiente coche en el instante t
+        coche = next(coches, None)
+        if coche is not None:
+            programa(t, LLEGA, coche)
+
+    def admite(cid, ticket):
+        direction = res.direccion[cid - 1]
+        carril[cid] = monitor.entra(direction, cid, res.clase[cid - 1], ticket=ticket)
+        res.entra[cid - 1] = reloj.ahora
+        res.orden.append(cid)
+        log(cid, f"from {direction} enters the tunnel")
+        programa(reloj.ahora + cruces.pop(cid), SALE, cid)
+
+    siguiente(0.0)
+    while eventos:
+        t, _, tipo, dato = heapq.heappop(eventos)
+        reloj.ahora = t
+        if tipo == LLEGA:
+            cid, direction, pausa, espera, cruce, clase = dato
+            res.direccion.append(direction)
+            res.clase.append(clase)
+            res.llegada.append(t)
+            res.quiere.append(None)
+            res.entra.append(None)
+            res.sale.append(None)
+            cruces[cid] = cruce
+            if traza is not None:
+                traza.creado(cid, direction, monitor)
+            log(cid, f"direction {direction} created")
+            programa(t + espera, QUIERE, cid)
+            siguiente(t + pausa)
+        elif tipo == QUIERE:
+            cid = dato
+            direction = res.direccion[cid - 1]
+            res.quiere[cid - 1] = t
+            log(cid, f"from {direction} wants to enter")
+            clase = res.clase[cid - 1]
+            ticket = monitor.solicita_entrar(direction, cid, 1, clase)
+            if monitor.reintenta(direction, 1, ticket, clase):
+                admite(cid, ticket)
+            else:
+                heapq.heappush(esperando[direction], (-clase, next(orden), ticket, cid))
+            despierta(monitor, esperando, admite)
+        elif tipo == VENCE:
+            monitor.revisa_turno()
+            despierta(monitor, esperando, admite)
+        else:
+            cid = dato
+            direction = res.direccion[cid - 1]
+            log(cid, f"from {direction} leaving the tunnel")
+            monitor.leaves_tunnel(direction, cid, carril.pop(cid))
+            res.sale[cid - 1] = t
+            log(cid, f"from {direction} out of the tunnel")
+            despierta(monitor, esperando, admite)
+        plazo = monitor.plazo()
+        if plazo is not None and plazo != vence and (esperando[NORTH] or esperando[SOUTH]):
+            # justo después del plazo, porque el turno vence cuando se supera
+            vence = plazo
+            programa(max(math.nextafter(plazo, math.inf), reloj.ahora), VENCE, None)
+    res.duracion = reloj.ahora
+    if traza is not None:
+        traza.vuelca()
+    res.cambios_turno = int(monitor.turn_switches.value)
+    res.despertares = int(monitor.wakeups.value)
+    res.despertares_espurios = int(monitor.spurious_wakeups.value)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulación del túnel con reloj virtual")
+    parser.add_argument("--version", type=int, choices=sorted(VERSIONES), default=1)
+    parser.add_argument("--ncars", type=int, default=NCARS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="muestra los mensajes de car() con el instante virtual")
+    parser.add_argument("--traza", metavar="FICHERO", help="guarda una traza binaria de la simulación")
+    parser.add_argument("--capacidad", type=int, help="coches que caben en cada carril (por defecto, sin límite)")
+    parser.add_argument("--carriles", type=int, default=1)
+    parser.add_argument("--separados", action="store_true", help="la mitad de los carriles para cada sentido")
+    parser.add_argument("--prioridad", nargs="+", metavar="CLASE:PROB", default=[],
+                        help="proporción de vehículos de cada clase prioritaria (p. ej. emergencia:0.01)")
+    parser.add_argument("--proceso", choices=sorted(PROCESOS),
+                        help="genera los coches con este proceso de llegadas de trafico.py")
+    parser.add_argument("--trafico", metavar="FICHERO",
+                        help="lee los coches de un fichero grabado (ver trafico.py) en lugar de generarlos")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    politica = politica_de_version(args.version)
+    prioridades = lee_prioridades(args.prioridad)
+    if args.trafico:
+        coches = lee(args.trafico)
+    elif args.proceso:
+        coches = genera(args.ncars, crea_proceso(args.proceso), args.seed, prioridades=prioridades)
+    else:
+        coches = llegadas(args.ncars, rng=random.Random(args.seed), prioridades=prioridades)
+    res = simular(politica, coches, verbose=args.verbose, traza=args.traza, capacidad=args.capacidad,
+                  carriles=args.carriles, separados=args.separados)
+    real = time.perf_counter() - inicio
+    bloqueados = res.bloqueados()
+    print(f"versión {args.version}: {len(res.llegada)} coches en {res.duracion:.2f} s virtuales "
+          f"({real:.2f} s reales)")
+    print(f"espera media para entrar: {res.espera_media():.4f} s")
+    for clase in sorted(set(res.clase) - {NORMAL}, reverse=True):
+        print(f"espera media de {CLASES[clase]}: {res.espera_media(clase):.4f} s "
+              f"({res.clase.count(clase)} coches)")
+    if bloqueados:
+        print(f"{len(bloqueados)} coches no llegan a entrar nunca")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+import numpy as np
+
+from analisis import por_coche
+from traza import QUIERE, ENTRA, SALE
+
+
+def test_por_coche_cuenta_el_primer_evento_repetido():
+    # el coche 0 de un convoy vuelve a solicitar entrar; en la traza sin ordenar el primero va después
+    c = {"cid": np.array([0, 0, 0, 1]), "tipo": np.array([QUIERE, QUIERE, ENTRA, QUIERE]),
+         "t": np.array([3.0, 1.0, 4.0, 2.0]), "direccion": np.array([0, 0, 0, 1])}
+    instantes, direccion = por_coche(c)
+    assert instantes[QUIERE].tolist() == [1.0, 2.0]
+    assert instantes[ENTRA, 0] == 4.0
+    assert np.isnan(instantes[SALE]).all()
+    assert direccion.tolist() == [0, 1]
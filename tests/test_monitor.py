@@ -0,0 +1,190 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from monitor import Monitor, NORTH, SOUTH, TURNO, WANTS, TICKET, SERVING, NOTIFIED, SERVICIO, EMERGENCIA
+from politicas import DrenarYCambiar, MaxCochesPorTurno, TurnoPorTiempo
+from simulacion import PrimitivasSimuladas, RelojVirtual
+from benchmark import ejecuta_caso
+from traza import Traza
+from concurrencia import Hilos, Asyncio
+
+
+def monitor_fifo(**tunel):
+    return Monitor(DrenarYCambiar(), primitivas=PrimitivasSimuladas, fifo=True, **tunel)
+
+
+def test_fifo_sin_limite_solo_entra_la_cabeza():
+    m = monitor_fifo()
+    tickets = [m.solicita_entrar(NORTH, cid) for cid in range(3)]
+    assert [m.puede_entrar(NORTH, t) for t in tickets] == [True, False, False]
+    m.entra(NORTH, 0, ticket=tickets[0])
+    assert [m.puede_entrar(NORTH, t) for t in tickets[1:]] == [True, False]
+
+
+def test_fifo_con_ventana_no_se_salta_al_que_espera():
+    m = monitor_fifo(capacidad=2)
+    tickets = [m.solicita_entrar(NORTH, cid) for cid in range(4)]
+    assert [m.puede_entrar(NORTH, t) for t in tickets] == [True, True, False, False]
+    # entra el segundo: la cabeza sigue siendo el primero, que conserva su sitio
+    m.entra(NORTH, 1, ticket=tickets[1])
+    assert m.estado[SERVING[NORTH]] == tickets[0]
+    assert [m.puede_entrar(NORTH, t) for t in (tickets[0], tickets[2], tickets[3])] == [True, False, False]
+
+
+def test_fifo_la_cabeza_avanza_por_los_retirados():
+    m = monitor_fifo()
+    tickets = [m.solicita_entrar(SOUTH, cid) for cid in range(4)]
+    m.retira(SOUTH, 1, ticket=tickets[1])
+    m.retira(SOUTH, 1, ticket=tickets[2])
+    assert m.estado[SERVING[SOUTH]] == tickets[0]
+    m.entra(SOUTH, 0, ticket=tickets[0])
+    assert m.estado[SERVING[SOUTH]] == tickets[3]
+    assert m.puede_entrar(SOUTH, tickets[3])
+
+
+def test_fifo_avisa_desde_la_cabeza():
+    m = monitor_fifo()
+    m.entra(SOUTH, 100) # el túnel está ocupado por el otro sentido
+    tickets = [m.solicita_entrar(NORTH, cid) for cid in range(3)]
+    m.sale(SOUTH, 100)
+    avisos = [m.condicion(NORTH, t).avisos for t in tickets]
+    assert avisos == [1, 0, 0]
+
+
+def test_fifo_sin_avisos_espurios_con_hilos():
+    # cada aviso despierta solo al número que puede entrar
+    caso = ejecuta_caso(MaxCochesPorTurno(2), backend="hilos", ncars=300, escala=0.002, limite=10,
+                        capacidad=3, fifo=True)
+    assert caso["bloqueados"] == 0
+    assert caso["despertares_espurios"] <= 3
+
+
+def test_fifo_con_prioritarios_no_bloquea_con_hilos():
+    # los números normales que esperaban por un prioritario vuelven a recibir aviso
+    for seed in range(3):
+        caso = ejecuta_caso(DrenarYCambiar(), backend="hilos", ncars=400, escala=0.002, limite=5, fifo=True,
+                            seed=seed, prioridades={SERVICIO: 0.1, EMERGENCIA: 0.05})
+        assert caso["bloqueados"] == 0
+
+
+def test_espera_con_el_plazo_vencido_es_cero():
+    reloj = RelojVirtual(1.0)
+    m = Monitor(TurnoPorTiempo(2.0), primitivas=PrimitivasSimuladas, reloj=reloj)
+    m.entra(SOUTH, 1) # empieza el turno del sur, con plazo en el instante 3
+    reloj.ahora = 2.0
+    assert m.espera(NORTH) == 1.0
+    assert m.espera(SOUTH) is None
+    reloj.ahora = 5.0
+    assert m.espera(NORTH) == 0.0
+
+
+def test_vencer_la_espera_descuenta_el_aviso():
+    # un aviso que llega a la vez que vence la espera no debe quedarse contado
+    reloj = RelojVirtual(1.0)
+    m = Monitor(TurnoPorTiempo(2.0), primitivas=PrimitivasSimuladas, reloj=reloj)
+    m.entra(SOUTH, 1)
+    ticket = m.solicita_entrar(NORTH, 2)
+    m.estado[NOTIFIED[NORTH]] = 1
+    assert not m.al_despertar(NORTH, 1, ticket, avisado=False) # el sur sigue dentro
+    assert m.estado[NOTIFIED[NORTH]] == 0
+
+
+def en_hilo(f, *args):
+    # ejecuta f en un hilo y devuelve el hilo y una lista en la que deja su resultado
+    resultado = []
+    h = threading.Thread(target=lambda: resultado.append(f(*args)), daemon=True)
+    h.start()
+    return h, resultado
+
+
+def espera_a(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "no se cumple a tiempo"
+        time.sleep(0.001)
+
+
+def test_convoy_avisado_descuenta_el_aviso_con_hilos():
+    m = Hilos().monitor(MaxCochesPorTurno(2))
+    carril = m.wants_enter(NORTH, 1)
+    convoy, carriles = en_hilo(m.wants_enter_many, SOUTH, 3, 10)
+    espera_a(lambda: m.estado[WANTS[SOUTH]] == 3)
+    m.leaves_tunnel(NORTH, 1, carril) # el turno pasa al sur y se avisa al convoy
+    convoy.join(5)
+    assert len(carriles[0]) == 2 # entran MAX y el resto se retira
+    assert m.estado[NOTIFIED[SOUTH]] == 0
+    m.leaves_tunnel_many(SOUTH, 2, 10, carriles[0])
+    # un coche del sur que tiene que esperar vuelve a recibir aviso
+    carril = m.wants_enter(NORTH, 2)
+    coche, _ = en_hilo(m.wants_enter, SOUTH, 20)
+    espera_a(lambda: m.estado[WANTS[SOUTH]] == 1)
+    m.leaves_tunnel(NORTH, 2, carril)
+    coche.join(5)
+    assert not coche.is_alive()
+
+
+def test_convoy_que_espera_revisa_el_turno_al_vencer_con_hilos():
+    m = Hilos().monitor(TurnoPorTiempo(0.05))
+    carril = m.wants_enter(NORTH, 1) # empieza el turno del norte, que sigue dentro
+    convoy, carriles = en_hilo(m.wants_enter_many, SOUTH, 2, 10)
+    espera_a(lambda: m.turn.value == TURNO[SOUTH]) # vence el turno sin que salga nadie
+    m.leaves_tunnel(NORTH, 1, carril)
+    convoy.join(5)
+    assert len(carriles[0]) == 2
+
+
+def test_la_traza_limita_los_carriles(tmp_path):
+    traza = Traza(str(tmp_path / "t.traza"))
+    with pytest.raises(ValueError):
+        Monitor(DrenarYCambiar(), primitivas=PrimitivasSimuladas, traza=traza, carriles=traza.carriles + 1)
+    m = Monitor(DrenarYCambiar(), primitivas=PrimitivasSimuladas, traza=traza, carriles=traza.carriles)
+    m.sale(NORTH, 0, traza.carriles - 1) # el último carril cabe en el registro
+
+
+def solicitudes_cerradas(m, direction):
+    # nadie espera y todos los números dados están atendidos
+    return m.estado[WANTS[direction]] == 0 and m.estado[SERVING[direction]] == m.estado[TICKET[direction]]
+
+
+@pytest.mark.parametrize("fifo", [False, True])
+def test_convoy_se_parte_en_max(fifo):
+    m = Hilos().monitor(MaxCochesPorTurno(2), fifo=fifo)
+    carriles = m.wants_enter_many(NORTH, 3, 10)
+    assert carriles == [0, 0]
+    assert m.ncars_north_inside.value == 2
+    assert solicitudes_cerradas(m, NORTH) # el tercero se ha retirado
+    m.leaves_tunnel_many(NORTH, 2, 10, carriles)
+    assert m.ncars_north_inside.value == 0
+    assert m.wants_enter_many(NORTH, 1, 12) == [0] # y vuelve a solicitarlo
+    assert solicitudes_cerradas(m, NORTH)
+
+
+@pytest.mark.parametrize("fifo", [False, True])
+def test_convoy_se_parte_en_max_con_asyncio(fifo):
+    async def prueba():
+        m = Asyncio().monitor(MaxCochesPorTurno(2), fifo=fifo)
+        carriles = await m.wants_enter_many(NORTH, 3, 10)
+        assert carriles == [0, 0]
+        assert solicitudes_cerradas(m.monitor, NORTH)
+        await m.leaves_tunnel_many(NORTH, 2, 10, carriles)
+        assert m.monitor.ncars_north_inside.value == 0
+    asyncio.run(prueba())
+
+
+@pytest.mark.parametrize("fifo", [False, True])
+def test_convoy_despierta_al_salir_el_otro_sentido_con_hilos(fifo):
+    m = Hilos().monitor(DrenarYCambiar(), fifo=fifo)
+    carril = m.wants_enter(SOUTH, 1)
+    convoy, carriles = en_hilo(m.wants_enter_many, NORTH, 3, 10)
+    espera_a(lambda: m.estado[WANTS[NORTH]] == 3)
+    assert convoy.is_alive() # el sur sigue dentro
+    m.leaves_tunnel(SOUTH, 1, carril)
+    convoy.join(5)
+    assert carriles == [[0, 0, 0]]
+    assert m.ncars_north_inside.value == 3
+    assert solicitudes_cerradas(m, NORTH)
+    m.leaves_tunnel_many(NORTH, 3, 10, carriles[0])
+    assert m.ncars_north_inside.value == 0
@@ -0,0 +1,54 @@
+import asyncio
+
+from monitor import NORMAL
+from politicas import DrenarYCambiar
+from servidor import Servidor, Conexion, PETICION, RESPUESTA, ENTRAR, SALIR, OK, ERROR
+
+NORTE, SUR = 0, 1
+
+
+class Transporte():
+    """Lo que escribe el servidor en la conexión, sin socket."""
+
+    def __init__(self):
+        self.escrito = bytearray()
+
+    def write(self, datos):
+        self.escrito += datos
+
+    def is_closing(self):
+        return False
+
+
+def conversacion(*peticiones):
+    """Envía cada petición (id, operación, dirección, cid) por separado y devuelve las respuestas y el monitor."""
+    async def prueba():
+        servidor = Servidor(DrenarYCambiar())
+        con = Conexion(servidor)
+        transporte = Transporte()
+        con.connection_made(transporte)
+        for pid, op, d, cid in peticiones:
+            con.data_received(PETICION.pack(pid, op, d, NORMAL, cid))
+            await asyncio.sleep(0) # las respuestas se envían al final de la vuelta del bucle
+        return list(RESPUESTA.iter_unpack(bytes(transporte.escrito))), servidor.monitor
+    return asyncio.run(prueba())
+
+
+def test_entrar_con_un_cid_que_ya_esta_dentro():
+    respuestas, m = conversacion((1, ENTRAR, NORTE, 7), (2, ENTRAR, NORTE, 7), (3, SALIR, NORTE, 7))
+    assert respuestas == [(1, OK, 0), (2, ERROR, 0), (3, OK, 0)]
+    assert m.ncars_north_inside.value == 0
+    assert m.ncars_north_wants_enter.value == 0
+
+
+def test_entrar_con_un_id_o_un_cid_que_esperan():
+    respuestas, m = conversacion(
+        (1, ENTRAR, SUR, 1),   # entra el sur
+        (2, ENTRAR, NORTE, 2), # el norte espera
+        (2, ENTRAR, NORTE, 3), # mismo id sin responder
+        (4, ENTRAR, NORTE, 2), # mismo coche esperando
+        (5, SALIR, SUR, 1),    # sale el sur y entra el que esperaba
+    )
+    assert respuestas == [(1, OK, 0), (2, ERROR, 0), (4, ERROR, 0), (5, OK, 0), (2, OK, 0)]
+    assert m.ncars_north_inside.value == 1
+    assert m.ncars_north_wants_enter.value == 0
@@ -0,0 +1,345 @@
+"""
+TRÁFICO: cargas de trabajo con semilla y llegadas grabadas
+
+Genera los coches con el formato de concurrencia.llegadas, (cid, direction,
+pausa hasta el siguiente coche, espera antes de solicitar entrar, tiempo de
+cruce, clase), de uno en uno según se piden: nunca se tiene la lista entera
+en memoria, así que una carga de diez millones de coches ocupa lo mismo que
+una de diez (simulacion.simular también los lee de uno en uno).
+
+Una carga se compone de:
+
+    - un proceso de llegadas (PROCESOS), que da las pausas entre coches y la
+      probabilidad de que cada uno vaya al norte, con la misma tasa media:
+        poisson  tasa constante, como el main() original;
+        rafagas  MMPP de dos estados: periodos de calma y de ráfaga, de
+                 duración exponencial, con una tasa factor veces mayor en
+                 las ráfagas;
+        punta    hora punta: la tasa y la proporción de coches del norte
+                 suben y bajan en un ciclo de periodo dado;
+    - una distribución del tiempo de cruce (DISTRIBUCIONES_CRUCE), entre
+      ellas pareto y lognormal, de cola pesada;
+    - la espera antes de solicitar entrar, uniforme, y la clase de vehículo
+      (ver concurrencia.llegadas).
+
+Cada parte sortea con su propio generador derivado de la semilla, de modo
+que cambiar, por ejemplo, la distribución del cruce no cambia los instantes
+de llegada ni los sentidos de los coches.
+
+También se pueden leer (lee) y grabar (guarda) llegadas en un fichero, CSV
+si termina en .csv y binario si no. El CSV tiene las columnas t (instante de
+llegada, en orden creciente), direccion (north/south o 0/1), espera, cruce y,
+opcionalmente, clase; el binario, registros REGISTRO de 32 bytes con los
+mismos campos. Así se pueden reproducir llegadas de tráfico real.
+
+    python trafico.py genera --proceso rafagas --tasa 2 --ncars 10000000 --seed 1 --salida coches.bin
+    python trafico.py muestra coches.bin | head
+    python simulacion.py --version 3 --trafico coches.bin
+"""
+
+import sys
+import csv
+import math
+import struct
+import random
+import argparse
+
+from monitor import NORTH, SOUTH, TURNO, NORMAL, CLASES
+from concurrencia import cruce_uniforme, sortea_clase, lee_prioridades
+
+NCARS = 10
+
+# t, espera, cruce, direccion (monitor.TURNO), clase y relleno hasta 32 bytes
+REGISTRO = struct.Struct("<dddBB6x")
+
+CAPACIDAD = 4096 # registros por lectura o escritura del fichero binario
+
+DIRECCIONES = {TURNO[NORTH]: NORTH, TURNO[SOUTH]: SOUTH}
+
+
+# Distribuciones del tiempo de cruce: f(rng, media) -> segundos
+def cruce_exponencial(rng, media):
+    return rng.expovariate(1 / media)
+
+def cruce_constante(rng, media):
+    return media
+
+def cruce_pareto(rng, media, alfa=2.5):
+    # cola pesada con la media pedida: xm * alfa / (alfa - 1) = media
+    return media * (alfa - 1) / alfa * rng.paretovariate(alfa)
+
+def cruce_lognormal(rng, media, sigma=1.0):
+    # cola pesada con la media pedida: exp(mu + sigma² / 2) = media
+    return rng.lognormvariate(math.log(media) - sigma ** 2 / 2, sigma)
+
+DISTRIBUCIONES_CRUCE = {
+    "uniforme": cruce_uniforme,
+    "exponencial": cruce_exponencial,
+    "constante": cruce_constante,
+    "pareto": cruce_pareto,
+    "lognormal": cruce_lognormal,
+}
+
+
+class Poisson():
+    """Llegadas de Poisson de tasa constante."""
+    nombre = "poisson"
+
+    def __init__(self, tasa=2.0, prob_norte=0.5):
+        self.tasa = tasa
+        self.prob_norte = prob_norte
+
+    def pausas(self, rng):
+        while True:
+            yield rng.expovariate(self.tasa)
+
+    def norte(self, t):
+        # probabilidad de que el coche que llega en el instante t vaya al norte
+        return self.prob_norte
+
+    def __repr__(self):
+        return f"{self.nombre}(tasa={self.tasa:g}, prob_norte={self.prob_norte:g})"
+
+
+class Rafagas(Poisson):
+    """
+    Proceso de Poisson modulado por una cadena de Markov de dos estados
+    (MMPP): alterna periodos de calma y de ráfaga de duración exponencial
+    (medias calma y rafaga segundos), y en las ráfagas la tasa es factor
+    veces la de calma. La tasa media es tasa.
+    """
+    nombre = "rafagas"
+
+    def __init__(self, tasa=2.0, prob_norte=0.5, factor=10.0, calma=60.0, rafaga=10.0):
+        super().__init__(tasa, prob_norte)
+        self.factor = factor
+        self.calma = calma
+        self.rafaga = rafaga
+        # tasa * (calma + rafaga) = tasa_calma * calma + factor * tasa_calma * rafaga
+        self.tasas = (tasa * (calma + rafaga) / (calma + factor * rafaga),
+                      tasa * (calma + rafaga) / (calma + factor * rafaga) * factor)
+
+    def pausas(self, rng):
+        duraciones = (self.calma, self.rafaga)
+        estado = 0
+        queda = rng.expovariate(1 / duraciones[estado]) # hasta el siguiente cambio de estado
+        while True:
+            pausa = 0.0
+            while True:
+                x = rng.expovariate(self.tasas[estado])
+                if x <= queda:
+                    queda -= x
+                    break
+                # sin memoria: al cambiar de estado se sortea de nuevo con la otra tasa
+                pausa += queda
+                estado = 1 - estado
+                queda = rng.expovariate(1 / duraciones[estado])
+            yield pausa + x
+
+    def __repr__(self):
+        return (f"{self.nombre}(tasa={self.tasa:g}, prob_norte={self.prob_norte:g}, factor={self.factor:g}, "
+                f"calma={self.calma:g}, rafaga={self.rafaga:g})")
+
+
+class HoraPunta(Poisson):
+    """
+    Proceso de Poisson no homogéneo: a lo largo de cada periodo la tasa va
+    del valle (en t = 0) a pico veces el valle (a mitad del periodo) y
+    vuelve, y la proporción de coches del norte pasa de prob_norte a
+    sesgo, como el tráfico que entra a la ciudad por la mañana. La tasa
+    media es tasa. Se genera por aclarado (thinning).
+    """
+    nombre = "punta"
+
+    def __init__(self, tasa=2.0, prob_norte=0.5, pico=4.0, periodo=3600.0, sesgo=0.9):
+        super().__init__(tasa, prob_norte)
+        self.pico = pico
+        self.periodo = periodo
+        self.sesgo = sesgo
+        self.valle = 2 * tasa / (1 + pico) # la media de la curva es (1 + pico) / 2
+
+    def curva(self, t):
+        # 0 en el valle, 1 en la punta
+        return (1 - math.cos(2 * math.pi * t / self.periodo)) / 2
+
+    def tasa_en(self, t):
+        return self.valle * (1 + (self.pico - 1) * self.curva(t))
+
+    def pausas(self, rng):
+        maxima = self.valle * self.pico
+        t = 0.0
+        while True:
+            inicio = t
+            while True:
+                t += rng.expovariate(maxima)
+                if rng.random() * maxima < self.tasa_en(t):
+                    break
+            yield t - inicio
+
+    def norte(self, t):
+        return self.prob_norte + (self.sesgo - self.prob_norte) * self.curva(t)
+
+    def __repr__(self):
+        return (f"{self.nombre}(tasa={self.tasa:g}, prob_norte={self.prob_norte:g}, pico={self.pico:g}, "
+                f"periodo={self.periodo:g}, sesgo={self.sesgo:g})")
+
+
+PROCESOS = {p.nombre: p for p in (Poisson, Rafagas, HoraPunta)}
+
+
+def crea_proceso(nombre, tasa=2.0, prob_norte=0.5, **params):
+    return PROCESOS[nombre](tasa, prob_norte, **params)
+
+
+def flujos(seed=None):
+    """Un generador por cada parte de la carga; sin semilla, aleatorios."""
+    partes = ("llegadas", "sentido", "espera", "cruce", "clase")
+    if seed is None:
+        return {p: random.Random() for p in partes}
+    return {p: random.Random(f"{seed}:{p}") for p in partes}
+
+
+def genera(ncars=NCARS, proceso=None, seed=None, espera_max=6, cruce=cruce_uniforme, prioridades=None):
+    """
+    Genera ncars coches, de uno en uno, con llegadas del proceso dado (por
+    defecto, Poisson de tasa 2), el tiempo de cruce que devuelve cruce(rng)
+    y la proporción de cada clase prioritaria de prioridades ({clase: prob}).
+    Con la misma semilla se genera siempre la misma carga.
+    """
+    proceso = proceso or Poisson()
+    rng = flujos(seed)
+    pausas = proceso.pausas(rng["llegadas"])
+    t = 0.0
+    for cid in range(1, ncars + 1):
+        direction = NORTH if rng["sentido"].random() < proceso.norte(t) else SOUTH
+        espera = rng["espera"].random() * espera_max
+        tiempo = cruce(rng["cruce"])
+        clase = sortea_clase(rng["clase"], prioridades) if prioridades else NORMAL
+        pausa = next(pausas)
+        yield cid, direction, pausa, espera, tiempo, clase
+        t += pausa
+
+
+def _direccion(texto):
+    if texto in (NORTH, SOUTH):
+        return texto
+    return DIRECCIONES[int(texto)]
+
+
+def _clase(texto):
+    if not texto:
+        return NORMAL
+    return CLASES.index(texto) if texto in CLASES else int(texto)
+
+
+def _lee_csv(fichero):
+    with open(fichero, newline="", encoding="utf-8") as f:
+        for fila in csv.DictReader(f):
+            yield (float(fila["t"]), _direccion(fila["direccion"]), float(fila.get("espera") or 0),
+                   float(fila["cruce"]), _clase(fila.get("clase")))
+
+
+def _lee_binario(fichero):
+    with open(fichero, "rb") as f:
+        while True:
+            bloque = f.read(REGISTRO.size * CAPACIDAD)
+            if not bloque:
+                break
+            for t, espera, cruce, direccion, clase in REGISTRO.iter_unpack(bloque):
+                yield t, DIRECCIONES[direccion], espera, cruce, clase
+
+
+def lee(fichero):
+    """
+    Recorre los coches grabados en el fichero, de uno en uno, con el formato
+    de concurrencia.llegadas. La pausa de cada coche es la distancia hasta
+    el instante de llegada del siguiente (0 para el último).
+    """
+    registros = _lee_csv(fichero) if fichero.endswith(".csv") else _lee_binario(fichero)
+    anterior = None
+    cid = 0
+    for registro in registros:
+        if anterior is not None:
+            pausa = registro[0] - anterior[0]
+            if pausa < 0:
+                raise ValueError(f"{fichero}: el coche {cid + 1} llega antes que el {cid}")
+            yield (cid, anterior[1], pausa) + anterior[2:]
+        cid += 1
+        anterior = registro
+    if anterior is not None:
+        yield (cid, anterior[1], 0.0) + anterior[2:]
+
+
+def guarda(coches, fichero):
+    """Graba los coches en el fichero (CSV o binario) según se generan; devuelve cuántos son."""
+    if fichero.endswith(".csv"):
+        with open(fichero, "w", newline="", encoding="utf-8") as f:
+            return escribe_csv(coches, f)
+    n = 0
+    t = 0.0
+    with open(fichero, "wb") as f:
+        bufer = bytearray()
+        for _, direction, pausa, espera, cruce, clase in coches:
+            bufer += REGISTRO.pack(t, espera, cruce, TURNO[direction], clase)
+            t += pausa
+            n += 1
+            if n % CAPACIDAD == 0:
+                f.write(bufer)
+                bufer.clear()
+        f.write(bufer)
+    return n
+
+
+def escribe_csv(coches, f):
+    w = csv.writer(f)
+    w.writerow(["t", "direccion", "espera", "cruce", "clase"])
+    n = 0
+    t = 0.0
+    for _, direction, pausa, espera, cruce, clase in coches:
+        w.writerow([repr(t), direction, repr(espera), repr(cruce), CLASES[clase]])
+        t += pausa
+        n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera, graba y muestra cargas de coches del túnel")
+    sub = parser.add_subparsers(dest="orden", required=True)
+    g = sub.add_parser("genera", help="genera una carga con semilla y la graba en un fichero")
+    g.add_argument("--proceso", choices=sorted(PROCESOS), default="poisson")
+    g.add_argument("--tasa", type=float, default=2.0, help="coches por segundo (media)")
+    g.add_argument("--prob-norte", type=float, default=0.5)
+    g.add_argument("--param", nargs="+", metavar="NOMBRE=VALOR", default=[],
+                   help="parámetros del proceso, p. ej. factor=20 rafaga=5 o pico=6 periodo=600")
+    g.add_argument("--cruce", choices=sorted(DISTRIBUCIONES_CRUCE), default="uniforme")
+    g.add_argument("--cruce-media", type=float, default=1.5)
+    g.add_argument("--espera-max", type=float, default=6)
+    g.add_argument("--prioridad", nargs="+", metavar="CLASE:PROB", default=[],
+                   help="proporción de vehículos de cada clase prioritaria (p. ej. emergencia:0.01)")
+    g.add_argument("--ncars", type=int, default=NCARS)
+    g.add_argument("--seed", type=int, default=None)
+    g.add_argument("--salida", required=True, help="fichero .csv o binario")
+    m = sub.add_parser("muestra", help="escribe en CSV los coches de un fichero")
+    m.add_argument("fichero")
+    args = parser.parse_args()
+
+    if args.orden == "muestra":
+        try:
+            escribe_csv(lee(args.fichero), sys.stdout)
+        except BrokenPipeError:
+            sys.stderr.close()
+        return
+
+    params = {}
+    for texto in args.param:
+        nombre, _, valor = texto.partition("=")
+        params[nombre] = float(valor)
+    proceso = crea_proceso(args.proceso, args.tasa, args.prob_norte, **params)
+    dist = DISTRIBUCIONES_CRUCE[args.cruce]
+    coches = genera(args.ncars, proceso, args.seed, args.espera_max, lambda r: dist(r, args.cruce_media),
+                    lee_prioridades(args.prioridad))
+    n = guarda(coches, args.salida)
+    print(f"{n} coches de {proceso!r} en {args.salida}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+TRAZA BINARIA de la ejecución del túnel
+
+En lugar de hacer print en cada paso de cada coche, los eventos se guardan como
+registros binarios de tamaño fijo (FORMATO, 32 bytes) en un búfer de memoria de
+cada proceso, y el búfer se vuelca entero al fichero de traza cuando se llena
+o cuando termina el coche. Cada registro contiene:
+
+    t         instante (time.monotonic, o el reloj virtual en simulación)
+    cid       identificador del coche
+    direccion 0 norte, 1 sur (monitor.TURNO)
+    tipo      CREADO, QUIERE, ENTRA o SALE
+    turno     turno del monitor tras el evento
+    carril    carril por el que entra o sale el coche (0 en CREADO y QUIERE)
+    wants_n, wants_s, inside_n, inside_s
+              contadores del monitor tras el evento
+
+Los eventos QUIERE, ENTRA y SALE los registra el propio monitor con el mutex
+cogido, así que su orden en el tiempo es el orden real de las secciones
+críticas. Si el monitor no tiene traza (traza=None) el coste en wants_enter
+y leaves_tunnel es solo comprobar ese atributo.
+
+    python traza.py fichero.traza          muestra la traza en texto
+    python analisis.py fichero.traza       métricas y comprobación del invariante
+"""
+
+import os
+import sys
+import time
+import struct
+import argparse
+import weakref
+import threading
+
+from monitor import NORTH, SOUTH, TURNO, WANTS, INSIDE, TURN
+
+FORMATO = struct.Struct("<dIBBBBiiii")
+CARRILES = 256 # carriles que caben en el campo carril (un byte)
+
+# Tipos de evento
+CREADO = 0
+QUIERE = 1
+ENTRA = 2
+SALE = 3
+EVENTOS = {CREADO: "created", QUIERE: "wants to enter", ENTRA: "enters the tunnel",
+           SALE: "out of the tunnel"}
+
+DIRECCIONES = {TURNO[NORTH]: NORTH, TURNO[SOUTH]: SOUTH}
+
+# Descripción de un registro para numpy.dtype (ver analisis.py)
+CAMPOS = [("t", "<f8"), ("cid", "<u4"), ("direccion", "u1"), ("tipo", "u1"),
+          ("turno", "u1"), ("carril", "u1"), ("wants_n", "<i4"), ("wants_s", "<i4"),
+          ("inside_n", "<i4"), ("inside_s", "<i4")]
+
+CAPACIDAD = 4096 # registros por búfer
+
+# Trazas vivas en este proceso, para vaciar sus búferes al hacer fork
+_trazas = weakref.WeakSet()
+
+
+class Traza():
+    """
+    Búfer de registros de un proceso. Cada proceso (cada coche en el backend
+    de procesos) tiene su copia y la vuelca con una única escritura en modo
+    O_APPEND, de modo que los bloques de procesos distintos no se mezclan.
+    """
+    carriles = CARRILES # el monitor no admite más carriles con esta traza
+
+    def __init__(self, fichero, reloj=time.monotonic, capacidad=CAPACIDAD):
+        self.fichero = fichero
+        self.reloj = reloj
+        self.capacidad = capacidad
+        open(fichero, "wb").close() # cada ejecución empieza con la traza vacía
+        self._inicia()
+
+    def _inicia(self):
+        self.buf = bytearray(FORMATO.size * self.capacidad)
+        self.n = 0
+        self.cerrojo = threading.Lock()
+        _trazas.add(self)
+
+    def __getstate__(self):
+        # para los métodos de arranque spawn/forkserver: cada proceso empieza con su búfer vacío
+        return {"fichero": self.fichero, "reloj": self.reloj, "capacidad": self.capacidad}
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._inicia()
+
+    def _tras_fork(self):
+        # el hijo no debe volver a escribir los registros pendientes del padre
+        self.n = 0
+        self.cerrojo = threading.Lock()
+
+    def registra(self, cid, direction, tipo, monitor, carril=0):
+        e = monitor.estado
+        with self.cerrojo:
+            FORMATO.pack_into(self.buf, self.n * FORMATO.size, self.reloj(), cid, TURNO[direction],
+                              tipo, int(e[TURN]), carril, int(e[WANTS[NORTH]]), int(e[WANTS[SOUTH]]),
+                              int(e[INSIDE[NORTH]]), int(e[INSIDE[SOUTH]]))
+            self.n += 1
+            if self.n == self.capacidad:
+                self._vuelca()
+
+    def creado(self, cid, direction, monitor):
+        self.registra(cid, direction, CREADO, monitor)
+
+    def quiere(self, cid, direction, monitor):
+        self.registra(cid, direction, QUIERE, monitor)
+
+    def entra(self, cid, direction, monitor, carril=0):
+        self.registra(cid, direction, ENTRA, monitor, carril)
+
+    def sale(self, cid, direction, monitor, carril=0):
+        self.registra(cid, direction, SALE, monitor, carril)
+
+    def vuelca(self):
+        with self.cerrojo:
+            self._vuelca()
+
+    def _vuelca(self):
+        if self.n == 0:
+            return
+        fd = os.open(self.fichero, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, memoryview(self.buf)[:self.n * FORMATO.size])
+        finally:
+            os.close(fd)
+        self.n = 0
+
+
+def _vacia_tras_fork():
+    for traza in list(_trazas):
+        traza._tras_fork()
+
+os.register_at_fork(after_in_child=_vacia_tras_fork)
+
+
+def lee(fichero):
+    """Recorre los registros del fichero de traza como tuplas (t, cid, direccion, tipo, turno, ...)."""
+    with open(fichero, "rb") as f:
+        while True:
+            bloque = f.read(FORMATO.size * CAPACIDAD)
+            if not bloque:
+                break
+            yield from FORMATO.iter_unpack(bloque)
+
+
+def texto(registro):
+    t, cid, direccion, tipo, turno, carril, wants_n, wants_s, inside_n, inside_s = registro
+    donde = f" (lane {carril})" if tipo in (ENTRA, SALE) else ""
+    return (f"[{t:14.6f}] car {cid} from {DIRECCIONES[direccion]} {EVENTOS[tipo] + donde:27} "
+            f"turn={DIRECCIONES[turno]} inside={inside_n}/{inside_s} wants={wants_n}/{wants_s}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Muestra en texto una traza binaria del túnel")
+    parser.add_argument("fichero")
+    parser.add_argument("--ordenar", action="store_true",
+                        help="ordena por instante (los bloques de cada proceso se escriben por separado)")
+    args = parser.parse_args()
+
+    registros = lee(args.fichero)
+    if args.ordenar:
+        registros = sorted(registros)
+    try:
+        for r in registros:
+            print(texto(r))
+    except BrokenPipeError:
+        sys.stderr.close()
+
+if __name__ == '__main__':
+    main()
@@ -10,11 +10,12 @@ manera análoga.
 
 import time
 import random
-from multiprocessing import Lock, Condition, Process
-from multiprocessing import Value
+import multiprocessing
+from multiprocessing import Process
+
+from monitor import Monitor as MonitorTunel, NORTH, SOUTH
+from politicas import DrenarYCambiar
 
-SOUTH = "south"
-NORTH = "north"
 
 NCARS = 10
 """
@@ -27,61 +28,13 @@ INVARIANTE:
     north_inside > 0 -> south_inside = 0
     south_inside > 0 -> north_inside = 0
 """
-class Monitor():
-    
-   def __init__(self):
-       # Variable compartida para guardar el número de coches dentro del túnel que salen del norte
-       self.ncars_north_inside = Value('i',0)
-       # Variable compartida para guardar el número de coches dentro del túnel que salen del sur
-       self.ncars_south_inside = Value('i',0)
-       # Semáforo binario para garantizar la exclusión mutua
-       self.mutex = Lock()
-       # Variable condición para controlar que no haya coches del norte dentro del túnel
-       self.empty_north = Condition(self.mutex)
-       # Variable condición para controlar que no haya coches del sur dentro del túnel
-       self.empty_south = Condition(self.mutex)
-       # {INV}
+def politica(): # política de turnos de esta versión
+    return DrenarYCambiar()
 
-   # Función para comprobar que no hay coches del norte dentro del túnel
-   def is_empty_north(self):
-       return self.ncars_north_inside.value == 0
-   # Función para comprobar que no hay coches del sur dentro del túnel
-   def is_empty_south(self):
-       return self.ncars_south_inside.value == 0
-   
-    # Función para controlar el acceso al túnel
-   def wants_enter(self, direction):
-       # {INV}
-       self.mutex.acquire() # Garantizamos exclusión mutua
-       if direction == NORTH: 
-           # Para entrar en el túnel se espera a que no haya nadie del sentido opuesto dentro
-           self.empty_south.wait_for(self.is_empty_south) 
-           # {INV y ncars_south_inside = 0}
-           self.ncars_north_inside.value += 1 # se entra en el túnel
-           # {INV}
-       else: 
-           # Para entrar en el túnel se espera a que no haya nadie del sentido opuesto dentro
-           self.empty_north.wait_for(self.is_empty_north) 
-           # {INV y n_cars_north_inside = 0}
-           self.ncars_south_inside.value += 1 # entra en el túnel
-           # {INV}
-       self.mutex.release()
-
-   def leaves_tunnel(self, direction):
-       # {INV}
-       self.mutex.acquire() # Garantizamos exclusión mutua
-       if direction == NORTH:
-           self.ncars_north_inside.value -= 1 # sale del túnel
-           if self.is_empty_north(): # si nadie más de su sentido está en el túnel
-               # {INV y ncars_north_inside = 0}
-               self.empty_north.notify_all() # se avisa
-       else:
-           self.ncars_south_inside.value -= 1 # sale del túnel
-           if self.is_empty_south(): # si nadie más de su sentido está en el túnel
-               # {INV y ncars_south_inside = 0}
-               self.empty_south.notify_all()  # se avisa
-       self.mutex.release()
-       # {INV}
+class Monitor(MonitorTunel):
+    
+   def __init__(self, primitivas=multiprocessing, reloj=time.monotonic):
+       super().__init__(politica(), primitivas, reloj)
 
 
 def delay(n=3):
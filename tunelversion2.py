@@ -11,11 +11,12 @@ hayan salido todos los coches que habían entrado en el túnel.
 
 import time
 import random
-from multiprocessing import Lock, Condition, Process
-from multiprocessing import Value
+import multiprocessing
+from multiprocessing import Process
+
+from monitor import Monitor as MonitorTunel, NORTH, SOUTH
+from politicas import TurnoPorTiempo
 
-SOUTH = "south"
-NORTH = "north"
 TIME = 0.1 # tiempo máximo adjudicado a cada turno
 
 NCARS = 10
@@ -31,70 +32,14 @@ Invariante:
     turn = 1 y north_inside = 0 -> south_inside >= 0
 """
 
-class Monitor():
+def politica(): # política de turnos de esta versión
+    return TurnoPorTiempo(TIME)
+
+class Monitor(MonitorTunel):
     
-   def __init__(self):
-       # Variable compartida para guardar el número de coches dentro del túnel que salen del norte
-       self.ncars_north_inside = Value('i',0)
-       # Variable compartida para guardar el número de coches dentro del túnel que salen del sur
-       self.ncars_south_inside = Value('i',0)
-       # Variable compartida para guardar el tiempo en el que empieza un turno
-       self.time = Value('d',0)
-       # Variable compartida = 0, si es el turno de los coches en el norte y =1, si es el turno de los coches en el sur
-       self.turn = Value('i',0)
-       # Semáforo binario para garantizar la exclusión mutua
-       self.mutex = Lock()
-       # Variable condición para controlar la salida y entrada al túnel
-       self.turnosem = Condition(self.mutex)
-
-    # Función para comprobarsi un coche del norte puede entrar en el túnel
-   def es_turno_norte(self):
-       return self.turn.value == 0 and self.ncars_south_inside.value == 0
-   
-    # Función para comprobarsi un coche del sur puede entrar en el túnel
-   def es_turno_sur(self):
-       return self.turn.value == 1 and self.ncars_north_inside.value == 0
-   
-    # Función para controlar la entrada de coches en el túnel dada su dirección inicial
-   def wants_enter(self,direction):
-       #{INV}
-       self.mutex.acquire() # Para garantizar exclusión mutua con semáforo binario
-       if direction == NORTH:
-           # Espera a que sea su turno y no haya coches del sur dentro
-           self.turnosem.wait_for(self.es_turno_norte) 
-           #{INV y turn = 0 y south_inside = 0}
-           if self.time.value == 0: # si no hemos inicializado el tiempo de este turno
-               self.time.value = time.time() # guardamos el tiempo de inicio del turno
-           self.ncars_north_inside.value += 1 # entra en el túnel
-           # {INV}
-       else: 
-           # Espera a que sea su turno y no haya coches del norte dentro
-           self.turnosem.wait_for(self.es_turno_sur)
-           #{INV y turn = 1 y north_inside = 0}
-           if self.time.value == 0: # si no hemos inicializado el tiempo de ese turno
-               self.time.value = time.time() # guardamos el tiempo de inicio del turno
-           self.ncars_south_inside.value += 1 # entra en el túnel
-           # {INV}
-       self.mutex.release()
-
-   def leaves_tunnel(self, direction):
-       # {INV}
-       self.mutex.acquire() # Para garantizar exclusión mutua con un semáforo binario
-       if direction == NORTH:
-           self.ncars_north_inside.value -= 1 # Sale del túnel
-           if time.time() - self.time.value > TIME: # si se supera el tiempo máximo del turno
-               self.turn.value = 1 # cambio de turno
-               self.time.value = 0 # inicializo nuevo cambio de tiempo
-               self.turnosem.notify_all() # aviso a los waits
-
-       else:
-           self.ncars_south_inside.value -= 1 # Sale del túnel
-           if time.time() - self.time.value > TIME: # si se supera el tiempo máximo por turno
-               self.turn.value = 0 # cambio de turno
-               self.time.value = 0 # inicializo nuevo cambio de tiempo
-               self.turnosem.notify_all() # aviso a los waits
-       self.mutex.release()
-       # {INV}
+   def __init__(self, primitivas=multiprocessing, reloj=time.monotonic):
+       super().__init__(politica(), primitivas, reloj)
+
 
 def delay(n=3):
     time.sleep(random.random()*n)
@@ -14,84 +14,23 @@ opuesto, se cambia el turno al sentido opuesto.
 
 import time
 import random
-from multiprocessing import Lock, Condition, Process
-from multiprocessing import Value
+import multiprocessing
+from multiprocessing import Process
+
+from monitor import Monitor as MonitorTunel, NORTH, SOUTH
+from politicas import TurnoPorTiempoCediendo
 
-SOUTH = "south"
-NORTH = "north"
 TIME = 0.000000000001 # tiempo máximo del turno
 
 NCARS = 10
 
-class Monitor():
-    
-   def __init__(self):
-       # Variable compartida para guardar el número de coches del norte esperando a entrar
-       self.ncars_north_wants_enter= Value('i',0)
-       # Variable compartida para guardar el número de coches del sur esperando a entrar
-       self.ncars_south_wants_enter = Value('i',0)
-       # Variable compartida para guardar el número de coches dentro del túnel que salen del norte
-       self.ncars_north_inside = Value('i',0)
-       # Variable compartida para guardar el número de coches dentro del túnel que salen del sur
-       self.ncars_south_inside = Value('i',0)
-       # Variable compartida para guardar el tiempo en el que empieza un turno
-       self.time = Value('d',0)
-       # Variable compartida = 0, si es el turno de los coches en el norte y =1, si es el turno de los coches en el sur
-       self.turn = Value('i',0)
-       # Semáforo binario para garantizar la exclusión mutua
-       self.mutex = Lock()
-       # Variable condición para controlar la salida y entrada al túnel
-       self.turnosem = Condition(self.mutex)
-   
-   def es_turno_norte(self): # El turno es del norte si turn = 0
-       return self.turn.value == 0 and self.ncars_south_inside.value == 0
-   
-   def es_turno_sur(self): # El turno es del sur si turn = 1
-       return self.turn.value == 1 and self.ncars_north_inside.value == 0
-   
-   def tunel_libre(self): # El túnel está libre si no hay nadie dentro
-       return self.ncars_north_inside.value == 0 and self.ncars_south_inside.value == 0
-
-   # Para controlar el acceso al túnel
-   def wants_enter(self,direction):
-       self.mutex.acquire() # Garantizamos exclusión mutua
-       if direction == NORTH:
-           self.ncars_north_wants_enter.value += 1 # Para guardar el número de coches que solicitan entrar
-           self.turnosem.wait_for(self.es_turno_norte) # Espera a que sea su turno
-           self.ncars_north_wants_enter.value -= 1 # Para guardar el número de coches que solicitan entrar
-           if self.time.value == 0: # Inicializamos el tiempo de inicio del turno si no está inicializado
-               self.time.value = time.time() 
-           self.ncars_north_inside.value += 1  # Entra en el túnel
-       else: 
-           self.ncars_south_wants_enter.value += 1 # Para guardar el número de coches que solicitan entrar
-           self.turnosem.wait_for(self.es_turno_sur) # Espera a que sea su turno
-           self.ncars_south_wants_enter.value -= 1
-           if self.time.value == 0: # Inicializamos el tiempo de inicio del turno si no está inicializado
-               self.time.value = time.time()
-           self.ncars_south_inside.value += 1 # Entra en el túnel
-       self.mutex.release()
+def politica(): # política de turnos de esta versión
+    return TurnoPorTiempoCediendo(TIME)
 
-    # Para controlar la salida del túnel
-   def leaves_tunnel(self, direction):
-       self.mutex.acquire() # Garantizamos exclusión mutua
-       if direction == NORTH:
-           if (self.ncars_north_wants_enter.value == 0 or time.time() - self.time.value > TIME) and self.ncars_south_wants_enter.value > 0:
-               self.turn.value = 1 # para que no sigan entrando más del norte
-               self.time.value = 0 # inicializamos tiempo
-           self.ncars_north_inside.value -= 1 # sale del túnel
-           # si ha pasado el tiempo máximo o ninguno más del turno quiere entrar:
-           if self.tunel_libre(): # cuando el último sale del túnel
-               self.turnosem.notify_all() # aviso
-
-       else:
-           if (self.ncars_south_wants_enter.value == 0 or time.time() - self.time.value > TIME) and self.ncars_north_wants_enter.value > 0:
-               self.turn.value = 0 # para que no entren más del norte
-               self.time.value = 0 # inicializamos tiempo
-           self.ncars_south_inside.value -= 1 # sale del túnel
-           # si ha pasado el tiempo máximo o ninguno más del turno quiere entrar:
-           if self.tunel_libre(): # cuando el último sale del túnel
-               self.turnosem.notify_all() # aviso
-       self.mutex.release()
+class Monitor(MonitorTunel):
+    
+   def __init__(self, primitivas=multiprocessing, reloj=time.monotonic):
+       super().__init__(politica(), primitivas, reloj)
 
 
 def delay(n=3):